@@ -7,15 +7,21 @@ import pprint
 import re
 import importlib
 import abc
+import asyncio
 import inspect
 import traceback
 import itertools
+import heapq
+import operator
+import collections
+import queue
+import threading
+import time
 
 from typing import List, Callable
 
 import importlib_metadata
 from jaraco.itertools import always_iterable
-from jaraco.collections import Projection
 from tempora import schedule
 
 import pmxbot.dictlib
@@ -144,16 +150,43 @@ class Handler:
     allow_chain = False
     "allow subsequent handlers to also process the same message"
 
+    dispatch_key = None
+    """
+    a key by which this handler may be located directly in the
+    dispatch index (see :class:`DispatchIndex`)
+    """
+
+    dispatch_substring = None
+    """
+    a substring which must appear in the (lowercased) message for
+    this handler to match (see :class:`DispatchIndex`)
+    """
+
     @classmethod
     def find_matching(cls, message, channel):
         """
         Yield ``cls`` subclasses that match message and channel
         """
-        return (
-            handler
-            for handler in cls._registry
-            if isinstance(handler, cls) and handler.match(message, channel)
-        )
+        return (handler for handler, matched in cls.find_matches(message, channel))
+
+    @classmethod
+    def find_matches(cls, message, channel):
+        """
+        Yield pairs of ``cls`` subclasses that match message and channel
+        and the (truthy) result of that match.
+        """
+        return cls._get_index().matching(message, channel)
+
+    @classmethod
+    def _get_index(cls):
+        """
+        Return the dispatch index for handlers of this class, rebuilding
+        it if the registry has changed since it was built.
+        """
+        index = vars(cls).get('_index')
+        if index is None or not index.covers(cls._registry):
+            index = cls._index = DispatchIndex(cls._registry, cls)
+        return index
 
     def __init__(self, **kwargs):
         self.__dict__.update(kwargs)
@@ -166,8 +199,9 @@ class Handler:
 
     def decorate(self, func):
         """
-        Decorate a handler function. The handler should accept keyword
-        parameters for values supplied by the bot, a subset of:
+        Decorate a handler function (which may be ``async``). The handler
+        should accept keyword parameters for values supplied by the bot,
+        a subset of:
         - client
         - connection (alias for client)
         - event
@@ -176,6 +210,8 @@ class Handler:
         - rest
         """
         self.func = func
+        # introspect the signature once, at registration
+        accepted_parameters(func)
         self._set_implied_name()
         self.register()
         return func
@@ -203,6 +239,13 @@ class Handler:
     def process(self, message):
         return message
 
+    def process_match(self, message, matched):
+        """
+        Given a message and the result of matching it, return the
+        value to be supplied to the handler as ``rest``.
+        """
+        return self.process(message)
+
     def attach(self, params):
         """
         Attach relevant params to func, returning a callable
@@ -211,15 +254,187 @@ class Handler:
         return attach(self.func, params)
 
 
+class DispatchIndex:
+    """
+    An index over a sorted registry of handlers.
+
+    Handlers with a ``dispatch_key`` (commands and aliases) are located
+    by a lookup on the first word of the message. Handlers with a
+    ``dispatch_substring`` (contains handlers) are grouped by that
+    substring, so each distinct substring is tested once against the
+    message, lowercased once, and only handlers whose substring was
+    found have their remaining restrictions applied. Only the other
+    handlers, including those of subclasses overriding ``match``, need
+    be tested against every message. Matches are yielded in registry
+    order, so priority is unaffected.
+    """
+
+    def __init__(self, registry, kind=Handler):
+        self.registry = registry
+        self.size = len(registry)
+        self.keyed = collections.defaultdict(list)
+        self.contained = collections.defaultdict(list)
+        self.scanned = []
+        for position, handler in enumerate(registry):
+            if not isinstance(handler, kind):
+                continue
+            self._target(handler).append((position, handler))
+
+    def _target(self, handler):
+        match = type(handler).match
+        if handler.dispatch_key is not None and match is CommandHandler.match:
+            return self.keyed[handler.dispatch_key]
+        if handler.dispatch_substring is not None and match is ContainsHandler.match:
+            return self.contained[handler.dispatch_substring]
+        return self.scanned
+
+    def covers(self, registry):
+        """
+        Is this index current for registry?
+        """
+        return registry is self.registry and len(registry) == self.size
+
+    @staticmethod
+    def key_for(message):
+        cmd, _, cmd_args = message.partition(' ')
+        return cmd.lower()
+
+    def _contained_in(self, message):
+        lowered = message.lower()
+        groups = (
+            group for substring, group in self.contained.items() if substring in lowered
+        )
+        return sorted(itertools.chain.from_iterable(groups))
+
+    def matching(self, message, channel):
+        """
+        Yield the handlers matching message and channel, in priority order,
+        each paired with the result of the match.
+        """
+        keyed = (
+            (position, handler, handler.match(message, channel))
+            for position, handler in self.keyed.get(self.key_for(message), ())
+        )
+        contained = (
+            (position, handler, handler.admits(channel))
+            for position, handler in self._contained_in(message)
+        )
+        scanned = (
+            (position, handler, handler.match(message, channel))
+            for position, handler in self.scanned
+        )
+        merged = heapq.merge(keyed, contained, scanned, key=operator.itemgetter(0))
+        return ((handler, matched) for position, handler, matched in merged if matched)
+
+
 def attach(func, params):
     """
     Given a function and a namespace of possible parameters,
     bind any params matching the signature of the function
     to that function.
     """
-    sig = inspect.signature(func)
-    params = Projection(sig.parameters.keys(), params)
-    return functools.partial(func, **params)
+    bound = bind(func, params)
+    if is_async(func):
+        return functools.partial(EventLoop.run, bound)
+    return bound
+
+
+def bind(func, params):
+    """
+    Bind any params matching the signature of func to func, without
+    arranging to run it if it is asynchronous (see :func:`attach`).
+    """
+    names = accepted_parameters(func)
+    return functools.partial(
+        func, **{name: params[name] for name in names if name in params}
+    )
+
+
+@functools.cache
+def accepted_parameters(func):
+    """
+    Return the names of the parameters accepted by func.
+
+    Introspecting the signature is comparatively expensive, so the
+    result is computed once per function.
+
+    >>> accepted_parameters(lambda channel, nick=None: None)
+    ('channel', 'nick')
+    """
+    return tuple(inspect.signature(func).parameters)
+
+
+@functools.cache
+def is_async(func):
+    """
+    Is func an ``async def`` function or asynchronous generator?
+    """
+    return inspect.iscoroutinefunction(func) or inspect.isasyncgenfunction(func)
+
+
+class EventLoop:
+    """
+    An asyncio event loop, run on a dedicated thread, on which
+    ``async def`` handlers are awaited. Handlers submitted to a
+    :class:`HandlerPool` are awaited concurrently, without blocking
+    any thread; otherwise the caller waits for each to complete.
+    """
+
+    _loop = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=cls._loop.run_forever, name='pmxbot-asyncio', daemon=True
+                )
+                thread.start()
+        return cls._loop
+
+    @classmethod
+    def run(cls, func):
+        """
+        Call func and run the coroutine or asynchronous generator it
+        returns to completion on the loop, returning the result (or the
+        items generated).
+        """
+        return cls.submit(_complete(func())).result()
+
+    @classmethod
+    def submit(cls, coroutine):
+        """
+        Schedule coroutine on the loop, returning a
+        :class:`concurrent.futures.Future` of its result.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, cls.get())
+
+
+async def _complete(result):
+    if inspect.isasyncgen(result):
+        return [item async for item in result]
+    return await result
+
+
+async def collect_async(func, exception_handler):
+    """
+    Await the handler func, returning its output as a list, with the
+    output of exception_handler in place of any after an exception
+    (as :func:`pmxbot.itertools.trap_exceptions` does).
+    """
+    output = []
+    try:
+        result = func()
+        if inspect.isasyncgen(result):
+            async for item in result:
+                output.append(item)
+        else:
+            output.extend(always_iterable(await result))
+    except Exception as exc:
+        output.extend(always_iterable(exception_handler(exc)))
+    return output
 
 
 class ContainsHandler(Handler):
@@ -230,12 +445,18 @@ class ContainsHandler(Handler):
     doc = None
     class_priority = 1
 
+    @property
+    def dispatch_substring(self):
+        return self.name
+
     def match(self, message, channel):
-        return (
-            self.name in message.lower()
-            and self._channel_match(channel)
-            and self._rate_match()
-        )
+        return self.name in message.lower() and self.admits(channel)
+
+    def admits(self, channel):
+        """
+        Apply the channel and rate restrictions for this handler.
+        """
+        return self._channel_match(channel) and self._rate_match()
 
     def _channel_match(self, channel):
         return (
@@ -280,6 +501,10 @@ class CommandHandler(Handler):
 
         return rem_alias(self) == rem_alias(other)
 
+    @property
+    def dispatch_key(self):
+        return f'!{self.name}'
+
     def match(self, message, channel):
         cmd, _, cmd_args = message.partition(' ')
         return cmd.lower() == f'!{self.name}'
@@ -308,6 +533,7 @@ class AliasHandler(CommandHandler):
 
 class RegexpHandler(ContainsHandler):
     class_priority = 4
+    dispatch_substring = None
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -320,6 +546,10 @@ class RegexpHandler(ContainsHandler):
     def process(self, message):
         return self.pattern.search(message)
 
+    def process_match(self, message, matched):
+        "Supply the match object from ``match`` rather than searching again."
+        return matched
+
 
 class ContentHandler(ContainsHandler):
     """
@@ -423,6 +653,160 @@ class ConfigMergeAction(argparse.Action):
         setattr(namespace, self.dest, functools.reduce(merge_dicts, values, {}))
 
 
+class HandlerJob:
+    "The output of a handler, to be evaluated for a channel."
+
+    def __init__(self, channel, results, on_timeout):
+        self.channel = channel
+        self.results = results
+        self.on_timeout = on_timeout
+        self.deadline = None
+        "when the job is abandoned, once it has started"
+        self.abandoned = False
+        self.future = None
+        "the future of results awaited on the event loop"
+
+
+class HandlerPool:
+    """
+    Evaluate handlers on a bounded pool of worker threads.
+
+    Handlers for any one channel are evaluated one at a time and in
+    the order submitted, so output (and logging) for each channel is
+    unchanged, but a slow handler no longer holds up other channels.
+    Output is collected for delivery by the bot from its own thread
+    (see :meth:`ready`).
+
+    A worker whose handler is abandoned is replaced, so handlers that
+    never return cannot exhaust the pool; the abandoned worker exits
+    if its handler ever does. Asynchronous handlers are awaited on the
+    :class:`EventLoop` rather than occupying a worker, and cancelled
+    if abandoned.
+    """
+
+    def __init__(self, size, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.running = {}
+        self.waiting = collections.defaultdict(collections.deque)
+        self.jobs = queue.SimpleQueue()
+        self.output = queue.SimpleQueue()
+        self.workers = itertools.count()
+        self.closed = False
+        for _ in range(size):
+            self._add_worker()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Construct a pool as configured by 'handler pool size' and
+        'handler timeout' (in seconds), or return None if no pool
+        is configured.
+        """
+        size = config.get('handler pool size')
+        return size and cls(size, config.get('handler timeout', 60))
+
+    def _add_worker(self):
+        name = f'pmxbot-handler-{next(self.workers)}'
+        threading.Thread(target=self._work, name=name, daemon=True).start()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None or self.closed:
+                return
+            self._evaluate(job)
+            if job.abandoned:
+                # replaced when the job was abandoned
+                return
+
+    def submit(self, channel, results, on_timeout):
+        """
+        Submit results (an iterable of messages) for evaluation on a
+        worker, or (a coroutine of a list of messages, such as from
+        :func:`collect_async`) to be awaited on the event loop. If the
+        handler does not complete within the timeout of starting, the
+        output of ``on_timeout()`` is delivered in its place.
+        """
+        job = HandlerJob(channel, results, on_timeout)
+        with self.lock:
+            if channel in self.running:
+                self.waiting[channel].append(job)
+            else:
+                self._start(job)
+
+    def _start(self, job):
+        self.running[job.channel] = job
+        if inspect.iscoroutine(job.results):
+            job.deadline = self.timeout and time.monotonic() + self.timeout
+            job.future = EventLoop.submit(self._await(job))
+        else:
+            self.jobs.put(job)
+
+    async def _await(self, job):
+        output = await job.results
+        with self.lock:
+            if not job.abandoned:
+                self._complete(job, output)
+
+    def _evaluate(self, job):
+        with self.lock:
+            job.deadline = self.timeout and time.monotonic() + self.timeout
+        try:
+            output = list(job.results)
+        except Exception:
+            log.exception("Unhandled exception evaluating handler")
+            output = []
+        with self.lock:
+            if job.abandoned:
+                return
+            self._complete(job, output)
+
+    def _complete(self, job, output):
+        self.output.put((job.channel, output))
+        del self.running[job.channel]
+        waiting = self.waiting.pop(job.channel, None)
+        if not waiting:
+            return
+        self._start(waiting.popleft())
+        if waiting:
+            self.waiting[job.channel] = waiting
+
+    def _expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [
+                job
+                for job in self.running.values()
+                if job.deadline and job.deadline < now
+            ]
+            for job in expired:
+                job.abandoned = True
+                self._complete(job, job.on_timeout())
+                if job.future:
+                    job.future.cancel()
+                else:
+                    self._add_worker()
+
+    def ready(self):
+        """
+        Yield (channel, output) for each handler ready for delivery,
+        in the order submitted for each channel.
+        """
+        self._expire()
+        while True:
+            try:
+                yield self.output.get_nowait()
+            except queue.Empty:
+                return
+
+    def shutdown(self):
+        self.closed = True
+        for _ in range(self.size):
+            self.jobs.put(None)
+
+
 class Bot(metaclass=abc.ABCMeta):
     """
     The abstract interface for the bot.
@@ -474,6 +858,21 @@ class Bot(metaclass=abc.ABCMeta):
         traceback.print_exc()
         return res
 
+    def _handle_timeout(self, handler):
+        log.warning("Timed out waiting for %s", handler.name or handler)
+        return [f"Sorry, {handler.name or 'that'} took too long."]
+
+    @functools.cached_property
+    def _handler_pool(self):
+        pool = HandlerPool.from_config(pmxbot.config)
+        if pool:
+            FinalRegistry.at_exit(pool.shutdown)
+        return pool
+
+    def _deliver_pooled(self):
+        for channel, output in self._handler_pool.ready():
+            self._handle_output(channel, output)
+
     def _handle_output(self, channel, output):
         """
         Given an initial channel and a sequence of messages or sentinels,
@@ -487,18 +886,28 @@ class Bot(metaclass=abc.ABCMeta):
         "Core message parser and dispatcher"
 
         messages = ()
-        for handler in Handler.find_matching(msg, channel):
+        for handler, matched in Handler.find_matches(msg, channel):
             exception_handler = functools.partial(
                 self._handle_exception, handler=handler
             )
-            rest = handler.process(msg)
+            rest = handler.process_match(msg, matched)
             client = connection = event = None
             # for regexp handlers
             match = rest
-            f = handler.attach(locals())
-            results = pmxbot.itertools.generate_results(f)
-            clean_results = pmxbot.itertools.trap_exceptions(results, exception_handler)
-            messages = itertools.chain(messages, clean_results)
+            if self._handler_pool and is_async(handler.func):
+                func = bind(handler.func, locals())
+                clean_results = collect_async(func, exception_handler)
+            else:
+                f = handler.attach(locals())
+                results = pmxbot.itertools.generate_results(f)
+                clean_results = pmxbot.itertools.trap_exceptions(
+                    results, exception_handler
+                )
+            if self._handler_pool:
+                timeout_handler = functools.partial(self._handle_timeout, handler)
+                self._handler_pool.submit(channel, clean_results, timeout_handler)
+            else:
+                messages = itertools.chain(messages, clean_results)
             if not handler.allow_chain:
                 break
         self._handle_output(channel, messages)
@@ -506,6 +915,9 @@ class Bot(metaclass=abc.ABCMeta):
     def init_schedule(self, scheduler):
         for handler in Scheduled._registry:
             scheduler.add(handler.as_cmd())
+        if self._handler_pool:
+            deliver = schedule.PeriodicCommand.after(0.1, self._deliver_pooled)
+            scheduler.add(deliver)
 
     def handle_scheduled(self, target):
         """
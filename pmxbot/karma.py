@@ -1,9 +1,21 @@
-import itertools
+import collections
+import datetime
+import json
+import logging
 import re
 import random
+import threading
+import time
+
+from jaraco.context import ExceptionTrap
+
+import pmxbot
 
 from . import storage
-from .core import command
+from .core import command, execdelay, FinalRegistry
+
+
+log = logging.getLogger(__name__)
 
 
 class SameName(ValueError):
@@ -14,17 +26,224 @@ class AlreadyLinked(ValueError):
     pass
 
 
+class WriteBack(threading.Thread):
+    """
+    Coalesce the karma changes to store, writing the net change to
+    each thing once every ``interval`` seconds. The pending changes
+    of at most ``size`` things are kept; beyond that, the pending
+    change of the least recently changed thing is written at once.
+    """
+
+    def __init__(self, store, interval, size):
+        super().__init__(name='pmxbot-karma-writer', daemon=True)
+        self.store = store
+        self.interval = interval
+        self.size = size
+        self.pending = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def add(self, thing, change):
+        with self.lock:
+            self.pending[thing] = self.pending.pop(thing, 0) + change
+            if len(self.pending) > self.size:
+                self.store._apply(*self.pending.popitem(last=False))
+
+    def flush(self):
+        "Write all pending changes."
+        with self.lock:
+            while self.pending:
+                self.store._apply(*self.pending.popitem(last=False))
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                log.exception("Unable to write karma changes")
+
+    def stop(self):
+        "Stop the writer and write any pending changes."
+        self.stopped.set()
+        self.join()
+        self.flush()
+
+
+class Leaderboard:
+    """
+    The ``size`` highest and lowest karma entries of store, kept in
+    memory.
+
+    Changes written through the store update the board in place.
+    Changes by other processes (such as the bot's, as seen by the
+    viewer) are seen when the board is reloaded, at most ``ttl``
+    seconds after it was last loaded.
+    """
+
+    def __init__(self, store, size, ttl):
+        self.store = store
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.loaded = None
+        self.top = []
+        "the highest entries, highest first"
+        self.bottom = []
+        "the lowest entries, lowest first"
+
+    def load(self):
+        with self.lock:
+            self._load()
+
+    def _load(self):
+        self.top = self.store._list(self.size)
+        self.bottom = self.store._list(-self.size)[::-1]
+        self.loaded = time.monotonic()
+
+    def invalidate(self):
+        "Reload the board when next read."
+        with self.lock:
+            self.loaded = None
+
+    def get(self, select):
+        """
+        Return the select highest (or, if negative, lowest)
+        entries, highest first.
+        """
+        with self.lock:
+            if self.loaded is None or time.monotonic() - self.loaded > self.ttl:
+                self._load()
+            return self.top[:select] if select > 0 else self.bottom[:-select][::-1]
+
+    def update(self, thing):
+        "Update the board for the just written entry of thing."
+        entry = self.store._entry(thing)
+        with self.lock:
+            if self.loaded is None:
+                return
+            self.top = self._place(self.top, thing, entry, lambda value: -value)
+            self.bottom = self._place(self.bottom, thing, entry, lambda value: value)
+            if self.top is None or self.bottom is None:
+                self.loaded = None
+
+    def _place(self, board, thing, entry, rank):
+        """
+        Return board, ordered by rank of value, with the entry of thing
+        in its place, or None if the board can't be known without
+        reloading it (when its entry falls off a full board).
+        """
+        if board is None:
+            return None
+        others = [item for item in board if thing not in item[0]]
+        if len(board) < self.size:
+            # the board holds every entry
+            return sorted(others + [entry], key=lambda item: rank(item[1]))
+        if not others or rank(entry[1]) > rank(others[-1][1]):
+            return others if len(others) == self.size else None
+        ranked = sorted(others + [entry], key=lambda item: rank(item[1]))
+        return ranked[: self.size]
+
+
 class Karma(storage.SelectableStorage):
+    writer = None
+    "The WriteBack coalescing changes, if 'karma write interval' is set."
+
+    leaderboard = None
+    "The Leaderboard serving rankings, unless 'karma leaderboard size' is 0."
+
     @classmethod
     def initialize(cls):
         cls.store = cls.from_URI()
+        cls.store.init_leaderboard()
+        cls.store.init_writer()
         cls._finalizers.append(cls.finalize)
+        FinalRegistry.at_exit(cls.store.flush)
 
     @classmethod
     def finalize(cls):
         cls.store.close()
         del cls.store
 
+    def init_writer(self):
+        interval = pmxbot.config.get('karma write interval')
+        if not interval:
+            return
+        size = pmxbot.config.get('karma write cache size', 1000)
+        self.writer = WriteBack(self, interval, size)
+        self.writer.start()
+
+    def init_leaderboard(self):
+        size = pmxbot.config.get('karma leaderboard size', 100)
+        if not size:
+            return
+        ttl = pmxbot.config.get('karma leaderboard ttl', 60)
+        self.leaderboard = Leaderboard(self, size, ttl)
+        self.leaderboard.load()
+
+    def close(self):
+        if self.writer:
+            self.writer.stop()
+        super().close()
+
+    def flush(self):
+        "Write any pending changes."
+        if self.writer:
+            self.writer.flush()
+
+    def change(self, thing, change):
+        thing = thing.strip().lower()
+        change = int(change)
+        if self.writer:
+            self.writer.add(thing, change)
+        else:
+            self._apply(thing, change)
+
+    def _apply(self, thing, change):
+        self._change(thing, change)
+        if self.leaderboard:
+            self.leaderboard.update(thing)
+
+    def set(self, thing, value):
+        thing = thing.strip().lower()
+        self.flush()
+        self._set(thing, int(value))
+        if self.leaderboard:
+            self.leaderboard.update(thing)
+
+    def list(self, select=0):
+        """
+        Return the keys and value of the select highest (or, if
+        negative, lowest) karma entries, or all if select is 0,
+        highest first.
+        """
+        if self.leaderboard and 0 < abs(select) <= self.leaderboard.size:
+            return self.leaderboard.get(select)
+        return self._list(select)
+
+    def trending(self, days=7, select=10):
+        """
+        Return the keys and net change of up to select entries whose
+        karma rose most (or, if negative, fell most) over the last
+        days days (including today), from the daily totals.
+        """
+        since = datetime.date.today() - datetime.timedelta(days=days - 1)
+        return self._trending(since.isoformat(), select)
+
+    def compact_history(self):
+        """
+        Remove the changes logged more than 'karma log days' (default
+        30) ago and the daily totals of more than 'karma history days'
+        (default 365) ago. Either may be 0 to keep them all.
+        """
+        log_days = pmxbot.config.get('karma log days', 30)
+        history_days = pmxbot.config.get('karma history days', 365)
+        now = datetime.datetime.now()
+        if log_days:
+            self._remove_changes(now - datetime.timedelta(days=log_days))
+        if history_days:
+            cutoff = now.date() - datetime.timedelta(days=history_days)
+            self._remove_days(cutoff.isoformat())
+
     def link(self, thing1, thing2):
         """
         Link thing1 and thing2, adding the karma of each into
@@ -37,7 +256,12 @@ class Karma(storage.SelectableStorage):
             raise SameName("Attempted to link two of the same name")
         self.change(thing1, 0)
         self.change(thing2, 0)
-        return self._link(thing1, thing2)
+        self.flush()
+        try:
+            return self._link(thing1, thing2)
+        finally:
+            if self.leaderboard:
+                self.leaderboard.invalidate()
 
 
 class SQLiteKarma(Karma, storage.SQLiteStorage):
@@ -56,20 +280,108 @@ class SQLiteKarma(Karma, storage.SQLiteStorage):
                 primary key (karmakey)
             )
         '''
-        CREATE_KARMA_LOG_TABLE = '''
-            CREATE TABLE IF NOT EXISTS karma_log (
-                karmakey varchar,
-                logid INTEGER,
-                change INTEGER
-            )
-        '''
+        CREATE_KARMA_VALUE_INDEX = """
+            CREATE INDEX IF NOT EXISTS ix_karma_values_karmavalue
+            ON karma_values (karmavalue)
+            """
+        CREATE_KARMA_ID_INDEX = """
+            CREATE INDEX IF NOT EXISTS ix_karma_keys_karmaid
+            ON karma_keys (karmaid)
+            """
         self.db.execute(CREATE_KARMA_VALUES_TABLE)
         self.db.execute(CREATE_KARMA_KEYS_TABLE)
-        self.db.execute(CREATE_KARMA_LOG_TABLE)
+        self.db.execute(CREATE_KARMA_VALUE_INDEX)
+        self.db.execute(CREATE_KARMA_ID_INDEX)
+        for statement in self.HISTORY_CREATE_SQL:
+            self.db.execute(statement)
         self.db.commit()
+        self.init_keys_index()
+
+    HISTORY_CREATE_SQL = [
+        """
+        CREATE TABLE IF NOT EXISTS karma_changes (
+            id INTEGER NOT NULL,
+            datetime DATETIME NOT NULL,
+            karmakey VARCHAR NOT NULL,
+            change INTEGER NOT NULL,
+            PRIMARY KEY (id) )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS ix_karma_changes_datetime
+        ON karma_changes (datetime)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS karma_days (
+            day DATE NOT NULL,
+            karmakey VARCHAR NOT NULL,
+            change INTEGER NOT NULL,
+            changes INTEGER NOT NULL,
+            PRIMARY KEY (day, karmakey) )
+        WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS karma_days_insert
+        AFTER INSERT ON karma_changes BEGIN
+            INSERT INTO karma_days (day, karmakey, change, changes)
+            VALUES (date(new.datetime), new.karmakey, new.change, 1)
+            ON CONFLICT (day, karmakey) DO UPDATE SET
+                change = change + excluded.change,
+                changes = changes + 1;
+        END
+        """,
+    ]
+
+    KEYS_INDEX_CREATE_SQL = [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS karma_keys_fts
+        USING fts5(karmakey, tokenize='trigram')
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS karma_keys_fts_insert
+        AFTER INSERT ON karma_keys BEGIN
+            INSERT INTO karma_keys_fts (karmakey) VALUES (new.karmakey);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS karma_keys_fts_delete
+        AFTER DELETE ON karma_keys BEGIN
+            DELETE FROM karma_keys_fts WHERE karmakey = old.karmakey;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS karma_keys_fts_update
+        AFTER UPDATE OF karmakey ON karma_keys BEGIN
+            UPDATE karma_keys_fts SET karmakey = new.karmakey
+            WHERE karmakey = old.karmakey;
+        END
+        """,
+        "INSERT INTO karma_keys_fts (karmakey) SELECT karmakey FROM karma_keys",
+    ]
+
+    def init_keys_index(self):
+        """
+        Create the trigram index on the karma keys, kept current by
+        triggers, if SQLite supports it (3.34 or later).
+        """
+        if self._has_keys_index():
+            return
+        self.db.execute('BEGIN IMMEDIATE')
+        with ExceptionTrap(storage.sqlite.OperationalError) as trap:
+            for statement in self.KEYS_INDEX_CREATE_SQL:
+                self.db.execute(statement)
+        if trap:
+            self.db.execute('ROLLBACK')
+            log.warning("FTS5 trigrams unavailable; searching karma without an index")
+            return
+        self.db.execute('COMMIT')
+
+    def _has_keys_index(self):
+        query = "SELECT 1 FROM sqlite_master WHERE name = 'karma_keys_fts'"
+        return bool(self.db.execute(query).fetchone())
 
     def lookup(self, thing):
         thing = thing.strip().lower()
+        self.flush()
         LOOKUP_SQL = """
             SELECT karmavalue
             from karma_keys k
@@ -83,62 +395,111 @@ class SQLiteKarma(Karma, storage.SQLiteStorage):
             karma = 0
         return karma
 
-    def set(self, thing, value):
-        thing = thing.strip().lower()
-        value = int(value)
+    def _set(self, thing, value):
         UPDATE_SQL = """
             UPDATE karma_values SET karmavalue = ?
             where karmaid = (
                 select karmaid from karma_keys where karmakey = ?
             )
             """
-        res = self.db.execute(UPDATE_SQL, (value, thing))
-        if res.rowcount == 0:
-            INSERT_VALUE_SQL = 'INSERT INTO karma_values (karmavalue) VALUES (?)'
-            INSERT_KEY_SQL = 'INSERT INTO karma_keys (karmakey, karmaid) VALUES (?, ?)'
-            ins = self.db.execute(INSERT_VALUE_SQL, [value])
-            self.db.execute(INSERT_KEY_SQL, (thing, ins.lastrowid))
-        self.db.commit()
+        self._upsert(thing, UPDATE_SQL, value)
 
-    def change(self, thing, change):
-        thing = thing.strip().lower()
-        value = int(self.lookup(thing)) + int(change)
+    def _change(self, thing, change):
         UPDATE_SQL = """
-            UPDATE karma_values SET karmavalue = ?
+            UPDATE karma_values SET karmavalue = coalesce(karmavalue, 0) + ?
             where karmaid = (
                 select karmaid from karma_keys where karmakey = ?
             )
             """
-        res = self.db.execute(UPDATE_SQL, (value, thing))
-        if res.rowcount == 0:
-            INSERT_VALUE_SQL = 'INSERT INTO karma_values (karmavalue) VALUES (?)'
-            INSERT_KEY_SQL = 'INSERT INTO karma_keys (karmakey, karmaid) VALUES (?, ?)'
-            ins = self.db.execute(INSERT_VALUE_SQL, [value])
-            self.db.execute(INSERT_KEY_SQL, (thing, ins.lastrowid))
-        self.db.commit()
+        self._upsert(thing, UPDATE_SQL, change)
+        if change:
+            LOG_SQL = """
+                INSERT INTO karma_changes (datetime, karmakey, change)
+                VALUES (?, ?, ?)
+                """
+            self.db.execute(LOG_SQL, (datetime.datetime.now(), thing, change))
+
+    def _upsert(self, thing, update_sql, value):
+        """
+        Update the value of thing with update_sql or, if thing is
+        new, add it with value. An existing thing is updated in a
+        single statement; a new one is added in a transaction
+        excluding other writers, so concurrent changes aren't lost.
+        """
+        if self.db.execute(update_sql, (value, thing)).rowcount:
+            return
+        INSERT_VALUE_SQL = 'INSERT INTO karma_values (karmavalue) VALUES (?)'
+        INSERT_KEY_SQL = 'INSERT INTO karma_keys (karmakey, karmaid) VALUES (?, ?)'
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            if not self.db.execute(update_sql, (value, thing)).rowcount:
+                ins = self.db.execute(INSERT_VALUE_SQL, [value])
+                self.db.execute(INSERT_KEY_SQL, (thing, ins.lastrowid))
+            self.db.execute('COMMIT')
+        except Exception:
+            self.db.execute('ROLLBACK')
+            raise
+
+    def _list(self, select):
+        order = 'asc' if select < 0 else 'desc'
+        KARMA_LIST_SQL = f"""
+            SELECT json_group_array(k.karmakey), v.karmavalue
+            from (
+                SELECT karmaid, karmavalue from karma_values
+                order by karmavalue {order} limit ?
+            ) v
+            join karma_keys k on k.karmaid = v.karmaid
+            group by v.karmaid
+            order by v.karmavalue {order}
+            """
+        rows = self.db.execute(KARMA_LIST_SQL, [abs(select) or -1])
+        keysandkarma = [(json.loads(keys), value) for keys, value in rows]
+        if select < 0:
+            keysandkarma.reverse()
+        return keysandkarma
 
-    def list(self, select=0):
-        KARMIC_VALUES_SQL = """
-            SELECT karmaid, karmavalue
-            from karma_values order by karmavalue desc
+    def _trending(self, since, select):
+        order, sign = ('asc', '<') if select < 0 else ('desc', '>')
+        TRENDING_SQL = f"""
+            WITH trend AS (
+                SELECT k.karmaid, sum(d.change) as total
+                from karma_days d
+                join karma_keys k on k.karmakey = d.karmakey
+                where d.day >= ?
+                group by k.karmaid
+                having total {sign} 0
+                order by total {order}
+                limit ?
+            )
+            SELECT (
+                SELECT json_group_array(karmakey)
+                from karma_keys where karmaid = trend.karmaid
+            ), total
+            from trend
+            order by total {order}
             """
-        KARMA_KEYS_SQL = """
-            SELECT karmakey from karma_keys where karmaid = ?
+        rows = self.db.execute(TRENDING_SQL, [since, abs(select)])
+        return [(json.loads(keys), change) for keys, change in rows]
+
+    def _remove_changes(self, before):
+        query = "DELETE FROM karma_changes WHERE datetime < ?"
+        self.db.execute(query, [before])
+
+    def _remove_days(self, before):
+        self.db.execute("DELETE FROM karma_days WHERE day < ?", [before])
+
+    def _entry(self, thing):
+        "Return the keys and value of the entry of thing."
+        ENTRY_SQL = """
+            SELECT json_group_array(k.karmakey), v.karmavalue
+            from karma_keys t
+            join karma_values v on v.karmaid = t.karmaid
+            join karma_keys k on k.karmaid = t.karmaid
+            where t.karmakey = ?
+            group by v.karmaid
             """
-
-        karmalist = self.db.execute(KARMIC_VALUES_SQL).fetchall()
-        karmalist.sort(key=lambda x: int(x[1]), reverse=True)
-        if select > 0:
-            selected = karmalist[:select]
-        elif select < 0:
-            selected = karmalist[select:]
-        else:
-            selected = karmalist
-        keysandkarma = []
-        for karmaid, value in selected:
-            keys = [x[0] for x in self.db.execute(KARMA_KEYS_SQL, [karmaid])]
-            keysandkarma.append((keys, value))
-        return keysandkarma
+        keys, value = self.db.execute(ENTRY_SQL, [thing]).fetchone()
+        return json.loads(keys), value
 
     def _link(self, thing1, thing2):
         GET_KARMAID_SQL = 'SELECT karmaid FROM karma_keys WHERE karmakey = ?'
@@ -169,51 +530,145 @@ class SQLiteKarma(Karma, storage.SQLiteStorage):
         keys = sorted(x[0] for x in keys_cur)
         return keys, value
 
-    def search(self, term):
-        query = "SELECT distinct karmaid from karma_keys where karmakey like ?"
-        matches = (id for (id,) in self.db.execute(query, '%%' + term + '%%'))
-        return (self._lookup(id) for id in matches)
+    def search(self, term, limit=100):
+        """
+        Return the keys and value of up to limit entries with a key
+        containing term or, if term ends with '*', starting with the
+        rest of term, highest first.
+
+        Terms of three or more characters are found in the trigram
+        index (where available). Shorter terms are found by scanning
+        the keys, so prefer a prefix for those.
+        """
+        term = term.strip().lower()
+        if term.endswith('*'):
+            condition, params = self._prefix_condition(term[:-1])
+        elif len(term) >= 3 and self._has_keys_index():
+            condition = (
+                "karmakey IN ("
+                "SELECT karmakey FROM karma_keys_fts WHERE karma_keys_fts MATCH ?)"
+            )
+            params = ['"{}"'.format(term.replace('"', '""'))]
+        else:
+            condition = "karmakey LIKE ? ESCAPE '\\'"
+            params = ['%{}%'.format(re.sub(r'([\\%_])', r'\\\1', term))]
+        SEARCH_SQL = f"""
+            SELECT json_group_array(k.karmakey), v.karmavalue
+            from karma_values v
+            join karma_keys k on k.karmaid = v.karmaid
+            where v.karmaid in (SELECT karmaid from karma_keys where {condition})
+            group by v.karmaid
+            order by v.karmavalue desc
+            limit ?
+            """
+        rows = self.db.execute(SEARCH_SQL, [*params, limit])
+        return [(json.loads(keys), value) for keys, value in rows]
+
+    @staticmethod
+    def _prefix_condition(prefix):
+        """
+        A condition selecting the keys starting with prefix, as a range
+        of the primary key.
+        """
+        if not prefix:
+            return '1', []
+        bound = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return 'karmakey >= ? AND karmakey < ?', [prefix, bound]
 
     def export_all(self):
-        return self.list()
+        return self._list(0)
 
 
 class MongoDBKarma(Karma, storage.MongoDBStorage):
     collection_name = 'karma'
+    indexes = ['names', 'value']
+
+    def init_indexes(self):
+        super().init_indexes()
+        self._changes.create_index('datetime')
+        self._days.create_index([('day', 1), ('name', 1)], unique=True)
+
+    @property
+    def _changes(self):
+        "The log of changes"
+        return self.db.database['karma_changes']
+
+    @property
+    def _days(self):
+        "The daily totals of changes"
+        return self.db.database['karma_days']
 
     def lookup(self, thing):
         thing = thing.strip().lower()
+        self.flush()
         res = self.db.find_one({'names': thing})
         return res['value'] if res else 0
 
-    def set(self, thing, value):
-        thing = thing.strip().lower()
-        value = int(value)
+    def _set(self, thing, value):
         query = {'names': {'$elemMatch': {'$in': [thing]}}}
         oper = {'$set': {'value': value}, '$addToSet': {'names': thing}}
         self.db.update_one(query, oper, upsert=True)
 
-    def change(self, thing, change):
-        thing = thing.strip().lower()
-        change = int(change)
+    def _change(self, thing, change):
         query = {'names': {'$elemMatch': {'$in': [thing]}}}
         oper = {'$inc': {'value': change}, '$addToSet': {'names': thing}}
         self.db.update_one(query, oper, upsert=True)
-
-    def list(self, select=0):
-        res = list(self.db.find().sort('value', storage.pymongo.DESCENDING))
-
-        if select > 0:
-            selected = res[:select]
-        elif select < 0:
-            selected = res[select:]
-        else:
-            selected = res
-
-        def as_list(val):
-            return val if isinstance(val, list) else [val]
-
-        return [(as_list(rec['names']), rec['value']) for rec in selected]
+        if not change:
+            return
+        now = datetime.datetime.now()
+        self._changes.insert_one(dict(datetime=now, name=thing, change=change))
+        day = dict(day=now.date().isoformat(), name=thing)
+        totals = {'$inc': {'change': change, 'changes': 1}}
+        self._days.update_one(day, totals, upsert=True)
+
+    def _trending(self, since, select):
+        order = -1 if select >= 0 else 1
+        direction = '$gt' if select >= 0 else '$lt'
+        pipeline = [
+            {'$match': {'day': {'$gte': since}}},
+            {'$group': {'_id': '$name', 'change': {'$sum': '$change'}}},
+            {
+                '$lookup': {
+                    'from': self.db.name,
+                    'localField': '_id',
+                    'foreignField': 'names',
+                    'as': 'entry',
+                }
+            },
+            {'$unwind': '$entry'},
+            {
+                '$group': {
+                    '_id': '$entry._id',
+                    'names': {'$first': '$entry.names'},
+                    'change': {'$sum': '$change'},
+                }
+            },
+            {'$match': {'change': {direction: 0}}},
+            {'$sort': {'change': order}},
+            {'$limit': abs(select)},
+        ]
+        return [(rec['names'], rec['change']) for rec in self._days.aggregate(pipeline)]
+
+    def _remove_changes(self, before):
+        self._changes.delete_many({'datetime': {'$lt': before}})
+
+    def _remove_days(self, before):
+        self._days.delete_many({'day': {'$lt': before}})
+
+    def _list(self, select):
+        order = storage.pymongo.ASCENDING if select < 0 else storage.pymongo.DESCENDING
+        selected = list(self.db.find().sort('value', order).limit(abs(select)))
+        if select < 0:
+            selected.reverse()
+        return [self._as_entry(rec) for rec in selected]
+
+    def _entry(self, thing):
+        return self._as_entry(self.db.find_one({'names': thing}))
+
+    @staticmethod
+    def _as_entry(rec):
+        names = rec['names']
+        return (names if isinstance(names, list) else [names]), rec['value']
 
     def _link(self, thing1, thing2):
         rec = self.db.find_one({'names': thing2})
@@ -227,20 +682,27 @@ class MongoDBKarma(Karma, storage.MongoDBStorage):
         self.db.update_one(query, update)
         self.db.delete_one(rec)
 
-    def search(self, term):
-        pattern = re.compile('.*' + re.escape(term) + '.*')
-        return (
-            (rec['names'], rec['value']) for rec in self.db.find({'names': pattern})
-        )
+    def search(self, term, limit=100):
+        """
+        Return the keys and value of up to limit entries with a name
+        containing term or, if term ends with '*', starting with the
+        rest of term (found in the index on names), highest first.
+        """
+        term = term.strip().lower()
+        if term.endswith('*'):
+            pattern = re.compile('^' + re.escape(term[:-1]))
+        else:
+            pattern = re.compile(re.escape(term))
+        cursor = self.db.find({'names': pattern})
+        cursor = cursor.sort('value', storage.pymongo.DESCENDING).limit(limit)
+        return [self._as_entry(rec) for rec in cursor]
 
     def import_(self, item):
         names, value = item
         self.db.insert(dict(names=names, value=value))
 
     def _all_names(self):
-        return set(
-            itertools.chain.from_iterable(names for names, value in self.search(''))
-        )
+        return set(self.db.distinct('names'))
 
     def repair_duplicate_names(self):
         """
@@ -283,9 +745,26 @@ def _link_karma(actor, *nicks):
     return f"{' and '.join(nicks)} are now linked and have a score of {score}"
 
 
+def _trending_karma(days):
+    days = int(days or 7)
+    selection = Karma.store.trending(days)
+    if not selection:
+        return f"No karma has changed in the last {days} days"
+    trend = ' '.join(
+        '({}: {:+d})'.format(', '.join(n), change) for n, change in selection
+    )
+    return f"Trending over {days} days: {trend}"
+
+
 @command(aliases="k")
 def karma(nick, rest):
-    "Return or change the karma value for some(one|thing)"
+    """
+    Return or change the karma value for some(one|thing). Use
+    'trending [days]' for the things gaining the most karma lately.
+    """
+    trending = re.fullmatch(r'trending(?:\s+(\d+))?', rest.strip())
+    if trending:
+        return _trending_karma(trending.group(1))
     karmee = rest.strip('++').strip('--').strip('~~')
     if '++' in rest:
         Karma.store.change(karmee, 1)
@@ -329,3 +808,8 @@ def bottom10(rest):
     selection = Karma.store.list(topn)
     res = ' '.join('({}: {})'.format(', '.join(n), k) for n, k in selection)
     return res
+
+
+@execdelay('compact karma history', None, datetime.timedelta(days=1), repeat=True)
+def compact_karma_history():
+    Karma.store.compact_history()
@@ -1,4 +1,5 @@
 import re
+import json
 import random
 import datetime
 import itertools
@@ -8,6 +9,8 @@ import urllib.parse
 import socket
 import operator
 import logging
+import threading
+import collections
 
 import pytz
 from jaraco.context import ExceptionTrap
@@ -25,6 +28,34 @@ first = operator.itemgetter(0)
 _log = logging.getLogger(__name__)
 
 
+HIGHLIGHT_START, HIGHLIGHT_END = '\x12', '\x13'
+"""
+Control characters (not IRC formatting codes) marking the terms matched
+in a search result line, for the presentation to render.
+"""
+
+
+class InvalidCursor(ValueError):
+    "The cursor for a page of search results is malformed."
+
+
+def split_highlights(message):
+    """
+    Separate a search result line into the plain message and the
+    (start, end) offsets of the highlighted terms in it.
+
+    >>> split_highlights('the \\x12lazy\\x13 dog')
+    ('the lazy dog', [(4, 8)])
+    """
+    parts = re.split(f'{HIGHLIGHT_START}|{HIGHLIGHT_END}', message)
+    plain, offsets = '', []
+    for index, part in enumerate(parts):
+        if index % 2:
+            offsets.append((len(plain), len(plain) + len(part)))
+        plain += part
+    return plain, offsets
+
+
 class Logger(storage.SelectableStorage):
     "Base Logger class"
 
@@ -33,6 +64,7 @@ class Logger(storage.SelectableStorage):
         cls.store = cls.from_URI()
         _log.info(f"Logging with {cls.store.__class__.__name__}")
         cls._finalizers.append(cls.finalize)
+        core.FinalRegistry.at_exit(cls.store.flush)
 
     @classmethod
     def finalize(cls):
@@ -46,6 +78,92 @@ class Logger(storage.SelectableStorage):
     def list_channels(self):
         return self._list_channels()
 
+    def get_channel_day_counts(self, channel):
+        """
+        Return the number of messages logged in channel on each day.
+        """
+        raise NotImplementedError()
+
+    def get_day_logs(self, channel, day, start=None, end=None):
+        """
+        Return the time, nick, and message of each message logged in
+        channel on day, optionally only those from the start time
+        and before the end time (each as HH:MM[:SS]).
+        """
+        raise NotImplementedError()
+
+    def version(self):
+        """
+        Return a value which changes whenever a message is logged or
+        removed, for validating pages built from the logs.
+        """
+        raise NotImplementedError()
+
+    def last_messages(self):
+        """
+        Return the last message logged in each channel.
+        """
+        return {channel: self.last_message(channel) for channel in self.list_channels()}
+
+    def flush(self):
+        """
+        Ensure any messages not yet written are written.
+        """
+
+    search_limit = 200
+    "The most hits returned in a page of search results."
+
+    def search(self, *terms):
+        """
+        Search for messages containing all of terms, returning the first
+        page of results.
+        """
+        results, next = self.search_page(terms)
+        return results
+
+    def search_page(self, terms, before=None, limit=None):
+        """
+        Search for messages containing all of terms, the most recent
+        first, returning up to limit (at most ``search_limit``) hits with
+        their context, and a cursor for the next page (or None if there
+        are no more), to be passed as ``before``.
+        """
+        raise NotImplementedError()
+
+    def _page_limit(self, limit):
+        return min(limit or self.search_limit, self.search_limit)
+
+    def _merge_context(self, hits):
+        """
+        Build search results from hits, each a (channel, date, key, line,
+        window) where window is the lines around the hit (including it),
+        each paired with a key ordering it within the channel.
+
+        A hit whose window overlaps that of an earlier hit is merged into
+        the earlier result.
+        """
+        results = []
+        owners = {}
+        for channel, date, hit_key, line, window in hits:
+            keys = [key for key, _ in window]
+            owner = next((owners[key] for key in keys if key in owners), None)
+            if owner is None:
+                owner = dict(channel=channel, date=date, line=line, lines={})
+                results.append(owner)
+            for key, context in window:
+                owner['lines'].setdefault(key, context)
+                owners.setdefault(key, owner)
+            owner['lines'][hit_key] = line
+        return [
+            (
+                result['channel'],
+                result['date'],
+                self.make_anchor(result['line'][:2]),
+                [result['lines'][key] for key in sorted(result['lines'])],
+            )
+            for result in results
+        ]
+
     def clear(self):
         """
         Remove all messages from the database.
@@ -53,6 +171,63 @@ class Logger(storage.SelectableStorage):
 
 
 class SQLiteLogger(Logger, storage.SQLiteStorage):
+    """
+    Log messages to SQLite.
+
+    When 'log batch size' is configured, messages are written behind
+    in batches of up to that many, committed together, at most
+    'log batch interval' seconds (default 0.5) after they were logged.
+    """
+
+    INSERT_LOG_SQL = """
+        INSERT INTO logs
+        (datetime, channel, nick, message)
+        VALUES (?, ?, ?, ?)
+        """
+
+    _writers: dict[str, storage.SQLiteBatchWriter] = {}
+    _writer_users: collections.Counter = collections.Counter()
+    _writers_lock = threading.Lock()
+
+    def __init__(self, uri):
+        super().__init__(uri)
+        self.writer = self._get_writer(self.filename)
+
+    @classmethod
+    def _get_writer(cls, filename):
+        """
+        Get the writer shared by all loggers to filename, if so
+        configured, registering a user of it.
+        """
+        config = getattr(pmxbot, 'config', {})
+        size = config.get('log batch size')
+        if not size:
+            return None
+        with cls._writers_lock:
+            if filename not in cls._writers:
+                interval = config.get('log batch interval', 0.5)
+                writer = storage.SQLiteBatchWriter(
+                    filename, cls.INSERT_LOG_SQL, size, interval
+                )
+                writer.start()
+                cls._writers[filename] = writer
+            cls._writer_users[filename] += 1
+            return cls._writers[filename]
+
+    @classmethod
+    def _release_writer(cls, filename):
+        """
+        Unregister a user of the writer to filename, stopping it
+        if it was the last user.
+        """
+        with cls._writers_lock:
+            cls._writer_users[filename] -= 1
+            if cls._writer_users[filename] > 0:
+                return
+            del cls._writer_users[filename]
+            writer = cls._writers.pop(filename)
+        writer.stop()
+
     def init_tables(self):
         LOG_CREATE_SQL = '''
         CREATE TABLE IF NOT EXISTS logs (
@@ -76,18 +251,231 @@ class SQLiteLogger(Logger, storage.SQLiteStorage):
         self.db.execute(INDEX_DTC_CREATE_SQL)
         self.db.execute(INDEX_DT_CREATE_SQL)
         self.db.commit()
+        self.init_fulltext()
+        self._init_summary(
+            'channel_days', self.CHANNEL_DAYS_CREATE_SQL, self.CHANNEL_DAYS_FILL_SQL
+        )
+        self._init_summary('recent', self.RECENT_CREATE_SQL, self.RECENT_FILL_SQL)
+        self._init_summary(
+            'log_version', self.LOG_VERSION_CREATE_SQL, self.LOG_VERSION_FILL_SQL
+        )
+
+    FULLTEXT_CREATE_SQL = [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS logs_fts
+        USING fts5(message, content='logs', content_rowid='id')
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS logs_fts_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO logs_fts (rowid, message) VALUES (new.id, new.message);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS logs_fts_delete AFTER DELETE ON logs BEGIN
+            INSERT INTO logs_fts (logs_fts, rowid, message)
+            VALUES ('delete', old.id, old.message);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS logs_fts_update
+        AFTER UPDATE OF message ON logs BEGIN
+            INSERT INTO logs_fts (logs_fts, rowid, message)
+            VALUES ('delete', old.id, old.message);
+            INSERT INTO logs_fts (rowid, message) VALUES (new.id, new.message);
+        END
+        """,
+    ]
+
+    def init_fulltext(self):
+        """
+        Create the full text index on the messages, kept current by
+        triggers, if SQLite supports FTS5, indexing any messages already
+        logged in the same transaction.
+        """
+        if self._has_fulltext():
+            return
+        self.db.execute('BEGIN IMMEDIATE')
+        with ExceptionTrap(storage.sqlite.OperationalError) as trap:
+            for statement in self.FULLTEXT_CREATE_SQL:
+                self.db.execute(statement)
+            self.db.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
+        if trap:
+            self.db.execute('ROLLBACK')
+            _log.warning("FTS5 unavailable; searching logs without an index")
+            return
+        self.db.execute('COMMIT')
+
+    def _has_fulltext(self):
+        query = "SELECT 1 FROM sqlite_master WHERE name = 'logs_fts'"
+        return bool(self.db.execute(query).fetchone())
+
+    CHANNEL_DAYS_CREATE_SQL = [
+        """
+        CREATE TABLE IF NOT EXISTS channel_days (
+            channel VARCHAR NOT NULL,
+            day DATE NOT NULL,
+            messages INTEGER NOT NULL,
+            first DATETIME NOT NULL,
+            last DATETIME NOT NULL,
+            PRIMARY KEY (channel, day) )
+        WITHOUT ROWID
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS channel_days_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO channel_days (channel, day, messages, first, last)
+            VALUES (new.channel, date(new.datetime), 1, new.datetime, new.datetime)
+            ON CONFLICT (channel, day) DO UPDATE SET
+                messages = messages + 1,
+                first = min(first, excluded.first),
+                last = max(last, excluded.last);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS channel_days_delete AFTER DELETE ON logs BEGIN
+            UPDATE channel_days SET messages = messages - 1
+            WHERE channel = old.channel AND day = date(old.datetime);
+            DELETE FROM channel_days
+            WHERE channel = old.channel AND day = date(old.datetime)
+                AND messages <= 0;
+        END
+        """,
+    ]
+
+    CHANNEL_DAYS_FILL_SQL = """
+        INSERT INTO channel_days (channel, day, messages, first, last)
+        SELECT channel, date(datetime), count(*), min(datetime), max(datetime)
+        FROM logs
+        GROUP BY channel, date(datetime)
+        """
+
+    RECENT_CREATE_SQL = [
+        """
+        CREATE TABLE IF NOT EXISTS recent (
+            channel VARCHAR NOT NULL,
+            id INTEGER NOT NULL,
+            datetime DATETIME NOT NULL,
+            nick VARCHAR NOT NULL,
+            message TEXT,
+            PRIMARY KEY (channel) )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recent_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO recent (channel, id, datetime, nick, message)
+            VALUES (new.channel, new.id, new.datetime, new.nick, new.message)
+            ON CONFLICT (channel) DO UPDATE SET
+                id = excluded.id,
+                datetime = excluded.datetime,
+                nick = excluded.nick,
+                message = excluded.message
+            WHERE excluded.datetime >= recent.datetime;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS recent_delete AFTER DELETE ON logs
+        WHEN old.id = (SELECT id FROM recent WHERE channel = old.channel) BEGIN
+            DELETE FROM recent WHERE channel = old.channel;
+            INSERT INTO recent (channel, id, datetime, nick, message)
+            SELECT channel, id, datetime, nick, message
+            FROM logs
+            WHERE channel = old.channel
+            ORDER BY datetime DESC
+            LIMIT 1;
+        END
+        """,
+    ]
+
+    # SQLite takes the bare columns from the row having the max
+    RECENT_FILL_SQL = """
+        INSERT INTO recent (channel, id, datetime, nick, message)
+        SELECT channel, id, max(datetime), nick, message
+        FROM logs
+        GROUP BY channel
+        """
+
+    LOG_VERSION_CREATE_SQL = [
+        """
+        CREATE TABLE IF NOT EXISTS log_version (version INTEGER NOT NULL)
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS log_version_insert AFTER INSERT ON logs BEGIN
+            UPDATE log_version SET version = version + 1;
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS log_version_delete AFTER DELETE ON logs BEGIN
+            UPDATE log_version SET version = version + 1;
+        END
+        """,
+    ]
+
+    # message ids are reused once the last is deleted, so count the
+    #  writes instead
+    LOG_VERSION_FILL_SQL = "INSERT INTO log_version (version) VALUES (0)"
+
+    def _init_summary(self, table, statements, fill):
+        """
+        Create the summary table, kept current by the triggers in
+        statements. Messages logged before the summary was created are
+        summarized by the fill query, in the same transaction.
+        """
+        query = "SELECT 1 FROM sqlite_master WHERE name = ?"
+        if self.db.execute(query, [table]).fetchone():
+            return
+        self.db.execute('BEGIN IMMEDIATE')
+        if self.db.execute(query, [table]).fetchone():
+            self.db.execute('ROLLBACK')
+            return
+        for statement in statements:
+            self.db.execute(statement)
+        self.db.execute(fill)
+        self.db.execute('COMMIT')
+
+    def rebuild_channel_days(self):
+        """
+        Summarize the days logged in each channel from the logs.
+        """
+        self.flush()
+        self.db.execute('BEGIN')
+        self.db.execute('DELETE FROM channel_days')
+        self.db.execute(self.CHANNEL_DAYS_FILL_SQL)
+        self.db.execute('COMMIT')
+
+    def rebuild_recent(self):
+        """
+        Record the last message in each channel from the logs.
+        """
+        self.flush()
+        self.db.execute('BEGIN')
+        self.db.execute('DELETE FROM recent')
+        self.db.execute(self.RECENT_FILL_SQL)
+        self.db.execute('COMMIT')
+
+    def rebuild_fulltext(self):
+        """
+        Index all messages in the full text index.
+        """
+        self.flush()
+        self.db.execute("INSERT INTO logs_fts (logs_fts) VALUES ('rebuild')")
 
     def _message(self, channel, nick, msg):
-        INSERT_LOG_SQL = """
-            INSERT INTO logs
-            (datetime, channel, nick, message)
-            VALUES (?, ?, ?, ?)
-            """
         now = datetime.datetime.now()
-        self.db.execute(INSERT_LOG_SQL, [now, channel, nick, msg])
+        if self.writer:
+            self.writer.put([now, channel, nick, msg])
+            return
+        self.db.execute(self.INSERT_LOG_SQL, [now, channel, nick, msg])
         self.db.commit()
 
+    def flush(self):
+        if self.writer:
+            self.writer.flush()
+
+    def close(self):
+        if self.writer:
+            self._release_writer(self.filename)
+        super().close()
+
     def last_seen(self, nick):
+        self.flush()
         FIND_LAST_SQL = """
             SELECT datetime, channel
             FROM logs
@@ -118,6 +506,7 @@ class SQLiteLogger(Logger, storage.SQLiteStorage):
             """
         channel = channel.replace('#', '')
 
+        self.flush()
         cur = self.db.execute(LAST_N_IDS_SQL, [channel.lower(), nick, count])
         ids_to_delete = cur.fetchall()
         if ids_to_delete:
@@ -135,64 +524,133 @@ class SQLiteLogger(Logger, storage.SQLiteStorage):
         return map(first, self.db.execute(query))
 
     def get_channel_days(self, channel):
-        query = 'select distinct date(datetime) from logs where channel = ?'
+        query = 'select day from channel_days where channel = ?'
         return [x[0] for x in self.db.execute(query, [channel])]
 
-    def get_day_logs(self, channel, day):
+    def get_channel_day_counts(self, channel):
+        query = 'select day, messages from channel_days where channel = ?'
+        return dict(self.db.execute(query, [channel]))
+
+    def get_day_logs(self, channel, day, start=None, end=None):
         query = """
             SELECT time(datetime), nick, message from logs
-            where channel = ? and date(datetime) = ? order by datetime
+            where channel = ? and datetime >= ? and datetime < ?
+            order by datetime
             """
-        return self.db.execute(query, [channel, day])
+        next_day = datetime.date.fromisoformat(day) + datetime.timedelta(days=1)
+        start = f'{day} {start}' if start else day
+        end = f'{day} {end}' if end else next_day.isoformat()
+        return self.db.execute(query, [channel, start, end])
+
+    def search_page(self, terms, before=None, limit=None):
+        limit = self._page_limit(limit)
+        search = self._search_fulltext if self._has_fulltext() else self._search_like
+        hits = search(terms, self._parse_cursor(before), limit + 1)
+        more, hits = hits[limit:], hits[:limit]
+        next = str(hits[-1][0]) if more else None
+        return self._search_results(hits), next
 
-    def search(self, *terms):
+    @staticmethod
+    def _parse_cursor(cursor):
+        """
+        Return the id of the message before which to search (ids being
+        assigned in the order logged), or None to search from the last.
+        """
+        try:
+            return int(cursor) if cursor else None
+        except ValueError:
+            raise InvalidCursor(cursor)
+
+    def _search_results(self, hits):
+        windows = collections.defaultdict(list)
+        for hit_id, *context in self._get_context([hit[0] for hit in hits]):
+            windows[hit_id].append(((context[0], context[1]), tuple(context[2:])))
+        return self._merge_context(
+            (channel, date, (dt, id), (time, nick, shown), windows[id])
+            for id, date, time, dt, channel, nick, message, shown in hits
+        )
+
+    def _get_context(self, ids):
+        """
+        For each message in ids, the two messages in its channel on
+        either side of it (and itself), in one query.
+        """
+        CONTEXT_SQL = """
+            SELECT hit.id, ctx.datetime, ctx.id,
+                time(ctx.datetime), ctx.nick, ctx.message
+            FROM logs AS hit JOIN logs AS ctx ON ctx.id IN (
+                SELECT id FROM logs
+                WHERE channel = hit.channel AND datetime < hit.datetime
+                ORDER BY datetime DESC LIMIT 2
+            ) OR ctx.id = hit.id OR ctx.id IN (
+                SELECT id FROM logs
+                WHERE channel = hit.channel AND datetime > hit.datetime
+                ORDER BY datetime LIMIT 2
+            )
+            WHERE hit.id IN (SELECT value FROM json_each(?))
+            """
+        return self.db.execute(CONTEXT_SQL, [json.dumps(ids)]).fetchall()
+
+    def _search_fulltext(self, terms, before, limit):
+        """
+        The matches for terms in the full text index, with the terms
+        highlighted.
+        """
+        condition, cursor = ('AND logs_fts.rowid < ?', [before]) if before else ('', [])
+        SEARCH_SQL = f"""
+            SELECT logs.id, date(datetime), time(datetime), datetime,
+                channel, nick, logs.message,
+                highlight(logs_fts, 0, ?, ?)
+            FROM logs_fts JOIN logs ON logs.id = logs_fts.rowid
+            WHERE logs_fts MATCH ? {condition}
+            ORDER BY logs_fts.rowid DESC
+            LIMIT ?
+            """
+        phrases = ('"{}"'.format(term.replace('"', '""')) for term in terms)
+        highlight = [HIGHLIGHT_START, HIGHLIGHT_END]
+        params = [*highlight, ' '.join(phrases), *cursor, limit]
+        return self.db.execute(SEARCH_SQL, params).fetchall()
+
+    def _search_like(self, terms, before, limit):
+        """
+        Messages containing all of terms, found by scanning the logs.
+        """
+        condition, cursor = ('AND id < ?', [before]) if before else ('', [])
         SEARCH_SQL = (
             'SELECT id, date(datetime), time(datetime), datetime, '
-            'channel, nick, message FROM logs WHERE %s'
-            % (' AND '.join(["message like '%%%s%%'" % x for x in terms]))
+            'channel, nick, message, message FROM logs WHERE '
+            + ' AND '.join(["message LIKE ? ESCAPE '\\'"] * len(terms))
+            + f' {condition} ORDER BY id DESC LIMIT ?'
         )
-
-        matches = []
-        alllines = []
-        search_res = self.db.execute(SEARCH_SQL).fetchall()
-        for id, date, time, dt, channel, nick, message in search_res:
-            line = (time, nick, message)
-            if line in alllines:
-                continue
-            prev_q = """
-                SELECT time(datetime), nick, message
-                from logs
-                where channel = ?
-                    and datetime < ?
-                order by datetime desc
-                limit 2
-                """
-            prev2 = self.db.execute(prev_q, [channel, dt])
-            next_q = prev_q.replace('<', '>').replace('desc', 'asc')
-            next2 = self.db.execute(next_q, [channel, dt])
-            lines = prev2.fetchall() + [line] + next2.fetchall()
-            marker = self.make_anchor(line[:2])
-            matches.append((channel, date, marker, lines))
-            alllines.extend(lines)
-        return matches
+        patterns = ['%{}%'.format(re.sub(r'([\\%_])', r'\\\1', term)) for term in terms]
+        params = [*patterns, *cursor, limit]
+        return self.db.execute(SEARCH_SQL, params).fetchall()
 
     def _list_channels(self):
-        query = "SELECT distinct channel from logs"
+        self.flush()
+        query = "SELECT channel from recent"
         return (chan[0] for chan in self.db.execute(query).fetchall())
 
     def last_message(self, channel):
-        query = """
-            SELECT datetime, nick, message
-            from logs
-            where channel = ?
-            order by datetime desc
-            limit 1
-        """
+        self.flush()
+        query = "SELECT datetime, nick, message from recent where channel = ?"
         time, nick, message = self.db.execute(query, [channel]).fetchone()
         result = dict(datetime=time, nick=nick, message=message)
         parse_date(result)
         return result
 
+    def version(self):
+        self.flush()
+        return self.db.execute('SELECT version FROM log_version').fetchone()[0]
+
+    def last_messages(self):
+        self.flush()
+        query = "SELECT channel, datetime, nick, message from recent"
+        return {
+            channel: parse_date(dict(datetime=time, nick=nick, message=message))
+            for channel, time, nick, message in self.db.execute(query)
+        }
+
     def export_all(self):
         query = 'SELECT id, datetime, nick, message, channel from logs'
 
@@ -235,10 +693,9 @@ def parse_date(record):
 
 class MongoDBLogger(Logger, storage.MongoDBStorage):
     collection_name = 'logs'
+    indexes = ['datetime.d', 'channel']
 
     def _message(self, channel, nick, msg):
-        self.db.create_index('datetime.d')
-        self.db.create_index('channel')
         now = datetime.datetime.utcnow()
         doc = dict(
             channel=channel, nick=nick, message=msg, datetime=self._fmt_date(now)
@@ -301,54 +758,107 @@ class MongoDBLogger(Logger, storage.MongoDBStorage):
         query = dict(channel=channel)
         return self.db.find(query, projection=['datetime.d']).distinct('datetime.d')
 
-    def get_day_logs(self, channel, day):
+    def get_channel_day_counts(self, channel):
+        pipeline = [
+            {'$match': {'channel': channel}},
+            {'$group': {'_id': '$datetime.d', 'messages': {'$sum': 1}}},
+        ]
+        return {doc['_id']: doc['messages'] for doc in self.db.aggregate(pipeline)}
+
+    def get_day_logs(self, channel, day, start=None, end=None):
         query = {'channel': channel, 'datetime.d': day}
+        times = dict(filter(operator.itemgetter(1), [('$gte', start), ('$lt', end)]))
+        if times:
+            query['datetime.t'] = times
         cur = self.db.find(query).sort('_id')
         return (
             (rec['_id'].generation_time.time(), rec['nick'], rec['message'])
             for rec in cur
         )
 
-    def search(self, *terms):
-        patterns = [re.compile('.*' + term + '.*') for term in terms]
-        query = dict(message={'$all': patterns})
+    def search_page(self, terms, before=None, limit=None):
+        limit = self._page_limit(limit)
+        hits = self._find_hits(terms, self._parse_cursor(before), limit + 1)
+        more, hits = hits[limit:], hits[:limit]
+        next = str(hits[-1]['_id']) if more else None
+        return self._generate_search_results(hits), next
 
-        return self._generate_search_results(self.db.find(query))
+    @staticmethod
+    def _parse_cursor(cursor):
+        "Return the query selecting messages before cursor."
+        if not cursor:
+            return {}
+        try:
+            return {'_id': {'$lt': storage.bson.ObjectId(cursor)}}
+        except storage.bson.errors.InvalidId:
+            raise InvalidCursor(cursor)
+
+    def _find_hits(self, terms, query, limit):
+        patterns = [re.compile('.*' + term + '.*') for term in terms]
+        query.update(message={'$all': patterns})
+        cur = self.db.find(query).sort('_id', storage.pymongo.DESCENDING)
+        return list(cur.limit(limit))
 
     def _generate_search_results(self, matched_entries):
-        matches = []
-        alllines = []
-        for match in matched_entries:
-            channel = match['channel']
-
-            def row_date(row):
-                return row['_id'].generation_time.date()
-
-            def to_line(row):
-                return (row['_id'].generation_time.time(), row['nick'], row['message'])
-
-            line = to_line(match)
-            if line in alllines:
-                # we've seen this line in the context of a previous hit
-                continue
-            # get the context for this line
-            prev2 = (
-                self.db.find(dict(channel=match['channel'], _id={'$lt': match['_id']}))
-                .sort('_id', storage.pymongo.DESCENDING)
-                .limit(2)
-            )
-            prev2 = map(to_line, prev2)
-            next2 = (
-                self.db.find(dict(channel=match['channel'], _id={'$gt': match['_id']}))
-                .sort('_id', storage.pymongo.ASCENDING)
-                .limit(2)
+        def to_line(row):
+            return (row['_id'].generation_time.time(), row['nick'], row['message'])
+
+        matches = list(matched_entries)
+        windows = {doc['_id']: doc for doc in self._get_context(matches)}
+        return self._merge_context(
+            (
+                match['channel'],
+                match['_id'].generation_time.date(),
+                match['_id'],
+                to_line(match),
+                [
+                    (row['_id'], to_line(row))
+                    for row in itertools.chain(
+                        reversed(windows[match['_id']]['prev']),
+                        [match],
+                        windows[match['_id']]['next'],
+                    )
+                ],
             )
-            next2 = map(to_line, next2)
-            context = list(itertools.chain(prev2, [line], next2))
-            marker = self.make_anchor(line[:2])
-            matches.append((channel, row_date(match), marker, context))
-            alllines.extend(context)
-        return matches
+            for match in matches
+        )
+
+    def _get_context(self, matches):
+        """
+        For each of matches, the two messages in its channel on either
+        side of it, in one aggregation.
+        """
+
+        def neighbors(op, order):
+            return {
+                '$lookup': {
+                    'from': self.db.name,
+                    'let': {'channel': '$channel', 'id': '$_id'},
+                    'pipeline': [
+                        {
+                            '$match': {
+                                '$expr': {
+                                    '$and': [
+                                        {'$eq': ['$channel', '$$channel']},
+                                        {op: ['$_id', '$$id']},
+                                    ]
+                                }
+                            }
+                        },
+                        {'$sort': {'_id': order}},
+                        {'$limit': 2},
+                    ],
+                    'as': 'prev' if op == '$lt' else 'next',
+                }
+            }
+
+        pipeline = [
+            {'$match': {'_id': {'$in': [match['_id'] for match in matches]}}},
+            {'$project': {'_id': True, 'channel': True}},
+            neighbors('$lt', storage.pymongo.DESCENDING),
+            neighbors('$gt', storage.pymongo.ASCENDING),
+        ]
+        return self.db.aggregate(pipeline)
 
     def list_channels(self):
         return [doc['channel'] for doc in self._recent.find()]
@@ -361,6 +871,22 @@ class MongoDBLogger(Logger, storage.MongoDBStorage):
             message=rec['message'],
         )
 
+    def version(self):
+        # ids are never reused, so any insert changes the last and any
+        #  removal changes the count
+        doc = self.db.find_one(sort=[('_id', storage.pymongo.DESCENDING)])
+        return doc and f"{doc['_id']}-{self.db.estimated_document_count()}"
+
+    def last_messages(self):
+        return {
+            rec['channel']: dict(
+                datetime=rec['ref'].generation_time,
+                nick=rec['nick'],
+                message=rec['message'],
+            )
+            for rec in self._recent.find()
+        }
+
     def all_messages(self):
         return self.db.find()
 
@@ -412,13 +938,10 @@ class FullTextMongoDBLogger(MongoDBLogger):
             coll.create_index([('message', 'text')], background=True)
         return not trap
 
-    def search(self, *terms):
-        query = ' '.join(terms)
-        filter = {'$text': {'$search': query}}
-        score = dict(score={'$meta': 'textScore'})
-        cur = self.db.find(filter, projection=score)
-        resp = cur.sort('score', score['score']).limit(200)
-        return self._generate_search_results(resp)
+    def _find_hits(self, terms, query, limit):
+        query.update({'$text': {'$search': ' '.join(terms)}})
+        cur = self.db.find(query).sort('_id', storage.pymongo.DESCENDING)
+        return list(cur.limit(limit))
 
 
 class LegacyFullTextMongoDBLogger(FullTextMongoDBLogger):
@@ -435,13 +958,14 @@ class LegacyFullTextMongoDBLogger(FullTextMongoDBLogger):
         client = cls._get_collection(uri).database.client
         return client.server_info()['version'].startswith('2.4.')
 
-    def search(self, *terms):
-        query = ' '.join(terms)
+    def _find_hits(self, terms, query, limit):
         db = self.db.database
         collection_name = self.db.name
-        resp = db.command('text', collection_name, search=query)
+        resp = db.command(
+            'text', collection_name, search=' '.join(terms), filter=query, limit=limit
+        )
         docs = (res['obj'] for res in resp['results'])
-        return self._generate_search_results(docs)
+        return sorted(docs, key=operator.itemgetter('_id'), reverse=True)
 
 
 @command()
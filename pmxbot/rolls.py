@@ -87,12 +87,9 @@ class SQLiteLogger(ParticipantLogger, storage.SQLiteStorage):
 
 class MongoDBLogger(ParticipantLogger, storage.MongoDBStorage):
     collection_name = 'rolls'
+    indexes = [[('datetime.d', -1), ('channel', 1)]]
 
     def log(self, nick, channel, change):
-        self.db.ensure_index([
-            ('datetime.d', storage.pymongo.DESCENDING),
-            ('channel', storage.pymongo.ASCENDING),
-        ])
         now = datetime.datetime.utcnow()
         doc = dict(
             channel=channel,
@@ -100,4 +97,4 @@ class MongoDBLogger(ParticipantLogger, storage.MongoDBStorage):
             change=change,
             datetime=logging.MongoDBLogger._fmt_date(now),
         )
-        self.db.insert(doc)
+        self.db.insert_one(doc)
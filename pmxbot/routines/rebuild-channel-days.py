@@ -0,0 +1,13 @@
+import sys
+
+import pmxbot.logging
+
+
+def run():
+    logger = pmxbot.logging.SQLiteLogger(sys.argv[1])
+    logger.rebuild_channel_days()
+    logger.close()
+
+
+if __name__ == '__main__':
+    run()
@@ -1,10 +1,18 @@
 import sys
 import urllib.parse
-import pymongo
+
+import pmxbot.logging
 
 
 def run():
     url = sys.argv[1]
+    if not url.startswith('mongodb'):
+        logger = pmxbot.logging.SQLiteLogger(url)
+        logger.rebuild_recent()
+        logger.close()
+        return
+    import pymongo
+
     db_name = urllib.parse.urlparse(url).path.lstrip('/')
     db = pymongo.MongoClient(url)[db_name]
     for entry in db.logs.find():
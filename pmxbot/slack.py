@@ -82,7 +82,17 @@ class Bot(pmxbot.core.Bot):
     def run_scheduler_loop(self):
         while True:
             self.scheduler.run_pending()
-            time.sleep(0.1)
+            time.sleep(self._until_next_scheduled())
+
+    def _until_next_scheduled(self, limit=1.0):
+        """
+        Return the seconds until the next scheduled command is due,
+        but no more than ``limit``.
+        """
+        if not self.scheduler.queue:
+            return limit
+        remaining = self.scheduler.queue[0] - schedule.now()
+        return min(max(remaining.total_seconds(), 0), limit)
 
     def handle_message(self, msg):
         if msg.get('type') != 'message':
@@ -1,8 +1,12 @@
 import abc
+import collections
 import itertools
 import importlib
 import logging
+import queue
+import re
 import threading
+import time
 import urllib.parse
 from typing import List, Callable
 
@@ -68,9 +72,93 @@ class Storage:
         pass
 
 
-class SQLiteStorage(Storage, threading.local):
+class SQLiteConnections:
+    """
+    The SQLite connections of the process, shared by all stores.
+
+    Each thread is given one connection to each database file, opened
+    on first use and shared by every store on that file. Each store
+    class initializes its tables in a file once. When the last store
+    on a file is closed, all connections to that file are closed.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.connections = {}
+        self.users = collections.Counter()
+        self.initialized = set()
+
+    def acquire(self, store):
+        """
+        Register store as a user of its file and initialize its tables
+        if not yet done for its class.
+        """
+        key = store.filename, type(store)
+        with self.lock:
+            self.get(store.filename)
+            self.users[store.filename] += 1
+            if key in self.initialized:
+                return
+            store.init_tables()
+            self.initialized.add(key)
+
+    def release(self, store):
+        """
+        Unregister store, closing the connections to its file if it
+        was the last user.
+        """
+        with self.lock:
+            self.users[store.filename] -= 1
+            if self.users[store.filename] > 0:
+                return
+            del self.users[store.filename]
+            self.initialized = {
+                key for key in self.initialized if key[0] != store.filename
+            }
+            keys = [key for key in self.connections if key[0] == store.filename]
+            for key in keys:
+                self.connections.pop(key).close()
+
+    def get(self, filename):
+        "Get the connection to filename for the current thread."
+        key = filename, threading.get_ident()
+        try:
+            return self.connections[key]
+        except KeyError:
+            pass
+        db = SQLiteStorage.connect(filename, check_same_thread=False)
+        with self.lock:
+            self.connections[key] = db
+        log.debug("Opened connection to %s (%s open)", filename, self.stats())
+        return db
+
+    def stats(self):
+        """
+        Return the number of connections open to each file.
+        """
+        return collections.Counter(filename for filename, ident in self.connections)
+
+
+class SQLiteStorage(Storage):
     scheme = 'sqlite'
 
+    connections = SQLiteConnections()
+
+    pragmas = dict(journal_mode='wal')
+    """
+    Pragmas applied to each connection. Any of ``supported_pragmas``
+    in 'database params' override these.
+    """
+
+    supported_pragmas = (
+        'journal_mode',
+        'synchronous',
+        'cache_size',
+        'mmap_size',
+        'temp_store',
+        'busy_timeout',
+    )
+
     @classmethod
     def uri_matches(cls, uri):
         return uri.endswith('.sqlite')
@@ -79,20 +167,142 @@ class SQLiteStorage(Storage, threading.local):
         globals().update(sqlite=importlib.import_module('sqlite3'))
         self.uri = uri
         self.filename = urllib.parse.urlparse(uri).path
-        self.db = sqlite.connect(self.filename, isolation_level=None, timeout=20.0)
-        self.init_tables()
+        self.connections.acquire(self)
+
+    @property
+    def db(self):
+        return self.connections.get(self.filename)
+
+    @classmethod
+    def connect(cls, filename, **params):
+        """
+        Connect to the database in filename, applying the pragmas.
+        """
+        db = sqlite.connect(filename, isolation_level=None, timeout=20.0, **params)
+        for name, value in cls._get_pragmas().items():
+            db.execute(f'PRAGMA {name} = {value}')
+        return db
+
+    @classmethod
+    def _get_pragmas(cls):
+        params = getattr(pmxbot, 'config', {}).get('database params', {})
+        configured = {
+            name: params[name] for name in cls.supported_pragmas if name in params
+        }
+        pragmas = dict(cls.pragmas, **configured)
+        invalid = [
+            value
+            for value in pragmas.values()
+            if not re.fullmatch(r'-?\w+', str(value))
+        ]
+        if invalid:
+            raise ValueError(f"Invalid pragma values {invalid}")
+        return pragmas
 
     def init_tables(self):
         pass
 
     def close(self):
-        self.db.close()
-        del self.db
+        self.connections.release(self)
+
+
+class SQLiteBatchWriter(threading.Thread):
+    """
+    Execute ``sql`` for records on a dedicated thread and connection,
+    in batches of up to ``size`` records, each in a single transaction.
+    A batch is written once full or ``interval`` seconds after its
+    first record arrived. At most ``10 * size`` records may be pending;
+    beyond that, :meth:`put` blocks until the writer catches up.
+    """
+
+    def __init__(self, filename, sql, size, interval):
+        super().__init__(name='pmxbot-sqlite-writer', daemon=True)
+        self.filename = filename
+        self.sql = sql
+        self.size = size
+        self.interval = interval
+        self.pending = queue.Queue(size * 10)
+
+    _flush_marker = object()
+    "marker requesting that pending records be written immediately"
+
+    _stop_marker = object()
+    "marker requesting that the writer stop"
+
+    def put(self, record):
+        self._check_alive()
+        self.pending.put(record)
+
+    def flush(self):
+        "Write any pending records now, waiting for them to be written."
+        self._check_alive()
+        self.pending.put(self._flush_marker)
+        self.pending.join()
+
+    def _check_alive(self):
+        if not self.is_alive():
+            raise RuntimeError(f"The writer to {self.filename} has stopped")
+
+    def stop(self):
+        "Write any pending records and stop the writer."
+        self.pending.put(self._stop_marker)
+        self.join()
+
+    def run(self):
+        db = SQLiteStorage.connect(self.filename)
+        try:
+            while self._write(db, self._next_batch()):
+                pass
+        finally:
+            db.close()
+
+    def _is_marker(self, item):
+        return item is self._flush_marker or item is self._stop_marker
+
+    def _next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + self.interval
+        while not self._is_marker(batch[-1]) and len(batch) < self.size:
+            remaining = max(deadline - time.monotonic(), 0)
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, db, batch):
+        """
+        Write the records in batch, returning False if the writer
+        has been stopped.
+        """
+        records = [item for item in batch if not self._is_marker(item)]
+        try:
+            if records:
+                db.execute('BEGIN')
+                db.executemany(self.sql, records)
+                db.execute('COMMIT')
+        except Exception:
+            log.exception("Unable to write %d records", len(records))
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+        finally:
+            for item in batch:
+                self.pending.task_done()
+        return batch[-1] is not self._stop_marker
 
 
 class MongoDBStorage(Storage):
     scheme = 'mongodb'
 
+    indexes: List = []
+    """
+    Key specifications of the indexes on the collection, created once
+    when the store is constructed.
+    """
+
+    _clients: dict[str, object] = {}
+    _clients_lock = threading.Lock()
+
     @classmethod
     def uri_matches(cls, uri):
         return uri.startswith('mongodb:') or uri.startswith('mongodb+srv:')
@@ -104,12 +314,32 @@ class MongoDBStorage(Storage):
         )
         self.uri = host_uri
         self.db = self._get_collection(host_uri)
+        self.init_indexes()
+
+    def init_indexes(self):
+        """
+        Create the indexes and report those on the collection.
+        """
+        for keys in self.indexes:
+            self.db.create_index(keys)
+        names = ', '.join(sorted(self.db.index_information()))
+        log.info("Indexes on %s: %s", self.db.full_name, names)
+
+    @classmethod
+    def _get_client(cls, uri):
+        """
+        Get the client for uri, shared by all stores.
+        """
+        with cls._clients_lock:
+            if uri not in cls._clients:
+                client_params = pmxbot.config.get('database params', {})
+                cls._clients[uri] = pymongo.MongoClient(uri, **client_params)
+            return cls._clients[uri]
 
     @classmethod
     def _get_collection(cls, uri):
-        importlib.import_module('pymongo')
-        client_params = pmxbot.config.get('database params', {})
-        client = pymongo.MongoClient(uri, **client_params)
+        globals().update(pymongo=importlib.import_module('pymongo'))
+        client = cls._get_client(uri)
         uri_p = pymongo.uri_parser.parse_uri(uri)
         db_name = uri_p['database'] or 'pmxbot'
         return client[db_name][cls.collection_name]
@@ -1,4 +1,7 @@
 import os
+import re
+import json
+import contextlib
 import random
 import calendar
 import datetime
@@ -6,19 +9,30 @@ import textwrap
 import html
 import urllib.parse
 import operator
-import contextlib
 import functools
+import hashlib
+import threading
+import collections
+import gzip
+import zlib
 
 import cherrypy
+from cherrypy.lib import cptools, httputil
 import jinja2.loaders
 import pytz
 import inflect
 import importlib_resources as resources
 
 import pmxbot.core
+import pmxbot.dictlib
 import pmxbot.logging
 import pmxbot.util
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 jenv = jinja2.Environment(loader=jinja2.loaders.PackageLoader('pmxbot.web'))
 TIMEOUT = 10.0
 
@@ -67,6 +81,231 @@ def get_context():
     return d
 
 
+class PageCache:
+    """
+    Rendered pages, keyed by path and ETag, up to a total size in bytes,
+    beyond which the least recently used are evicted.
+    """
+
+    def __init__(self, size=16 * 2**20):
+        self.size = size
+        self.pages = collections.OrderedDict()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            page = self.pages.get(key)
+            if page is not None:
+                self.pages.move_to_end(key)
+            return page
+
+    def put(self, key, page):
+        if len(page) > self.size:
+            return
+        with self.lock:
+            self.total -= len(self.pages.pop(key, b''))
+            self.pages[key] = page
+            self.total += len(page)
+            while self.total > self.size:
+                _, evicted = self.pages.popitem(last=False)
+                self.total -= len(evicted)
+
+
+page_cache = PageCache()
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+encoders = {'gzip': gzip.compress}
+"Content encodings supported, by preference."
+
+if brotli:
+    encoders = {'br': brotli.compress, **encoders}
+
+
+def negotiate_encoding(supported=encoders):
+    """
+    Select the most preferred of the supported encodings accepted by
+    the client (or None to leave the response unencoded).
+    """
+    preference = list(supported)
+    accepted = (
+        element
+        for element in cherrypy.request.headers.elements('Accept-Encoding')
+        if element.value in supported and element.qvalue > 0
+    )
+    best = min(
+        accepted,
+        key=lambda element: (-element.qvalue, preference.index(element.value)),
+        default=None,
+    )
+    return best and best.value
+
+
+def tag(etag, encoding):
+    "The ETag of the encoded representation."
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+def compress(page, encoding):
+    """
+    Encode the page if an encoding was selected and the page is at least
+    the 'web compress threshold' in size.
+    """
+    cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+    threshold = pmxbot.config.get('web compress threshold', 1024)
+    if not encoding or len(page) < threshold:
+        return page
+    cherrypy.response.headers['Content-Encoding'] = encoding
+    return encoders[encoding](page)
+
+
+def compress_stream(chunks):
+    """
+    Gzip the chunks of a streamed response if the client accepts it.
+    """
+    cherrypy.response.headers['Vary'] = 'Accept-Encoding'
+    if not negotiate_encoding({'gzip': None}):
+        return chunks
+    cherrypy.response.headers['Content-Encoding'] = 'gzip'
+    return _gzip_stream(chunks)
+
+
+def _gzip_stream(chunks):
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+def conditional(render, etag, max_age=0, last_modified=None):
+    """
+    Return the page produced by render, unless the client's copy is
+    current (answering 304), or a rendering with the same etag is
+    cached. With a max_age, the page is immutable and may be cached
+    by clients that long; otherwise they must revalidate.
+
+    The page is compressed as negotiated, each encoding having its own
+    ETag and cache entry.
+    """
+    headers = cherrypy.response.headers
+    encoding = negotiate_encoding()
+    headers['ETag'] = tag(etag, encoding)
+    headers['Vary'] = 'Accept-Encoding'
+    headers['Cache-Control'] = (
+        f'public, max-age={max_age}, immutable' if max_age else 'no-cache'
+    )
+    if last_modified is not None:
+        headers['Last-Modified'] = httputil.HTTPDate(last_modified)
+    cptools.validate_etags()
+    cptools.validate_since()
+    path = cherrypy.request.path_info
+    encoded = page_cache.get((path, headers['ETag'])) if encoding else None
+    if encoded is not None:
+        headers['Content-Encoding'] = encoding
+        return encoded
+    page = page_cache.get((path, etag))
+    if page is None:
+        page = render()
+        page_cache.put((path, etag), page)
+    encoded = compress(page, encoding)
+    if encoded is not page:
+        page_cache.put((path, headers['ETag']), encoded)
+    return encoded
+
+
+class StaticAsset:
+    """
+    A packaged file, compressed once in each supported encoding
+    (unless already compressed, as are images).
+    """
+
+    def __init__(self, filename, content_type, compress=True):
+        self.content_type = content_type
+        data = (resources.files('pmxbot.web.templates') / filename).read_bytes()
+        self.etag = make_etag(filename, data)
+        self.encoded = {
+            encoding: encode(data) for encoding, encode in encoders.items() if compress
+        }
+        self.variants = {None: data, **self.encoded}
+
+    @cherrypy.expose
+    def default(self):
+        headers = cherrypy.response.headers
+        headers['Content-Type'] = self.content_type
+        encoding = negotiate_encoding(self.encoded)
+        headers['ETag'] = tag(self.etag, encoding)
+        headers['Vary'] = 'Accept-Encoding'
+        cptools.validate_etags()
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return self.variants[encoding]
+
+
+def int_param(name, value):
+    try:
+        return int(value)
+    except ValueError:
+        raise cherrypy.HTTPError(400, f"{name} must be an integer")
+
+
+def search_page(terms, before, limit):
+    """
+    Search the logs for a page of results, where no terms or a
+    malformed cursor (before) is a client error.
+    """
+    if not terms:
+        raise cherrypy.HTTPError(400, "term must contain a word to search for")
+    db = pmxbot.logging.Logger.store
+    # a hack to enable the database to create anchors when building search
+    #  results
+    db.make_anchor = make_anchor
+    try:
+        return db.search_page(terms, before=before, limit=limit)
+    except pmxbot.logging.InvalidCursor:
+        raise cherrypy.HTTPError(400, "before must be the cursor of a page")
+
+
+def search_line(message):
+    """
+    A search result line as the plain message and the (start, end)
+    offsets of its highlighted terms.
+    """
+    message, highlights = pmxbot.logging.split_highlights(message)
+    return dict(message=message, highlights=highlights)
+
+
+def highlight_html(message):
+    """
+    Escape a search result line for HTML, rendering its highlighted
+    terms as spans.
+
+    >>> print(highlight_html('a \\x12<b>\\x13 c'))
+    a <span class="termhi">&lt;b&gt;</span> c
+    """
+    plain, offsets = pmxbot.logging.split_highlights(message)
+    pieces, last = [], 0
+    for start, end in offsets:
+        pieces.append(html.escape(plain[last:start]))
+        pieces.append(f'<span class="termhi">{html.escape(plain[start:end])}</span>')
+        last = end
+    pieces.append(html.escape(plain[last:]))
+    return ''.join(pieces)
+
+
+jenv.filters['highlight'] = highlight_html
+
+
+def json_response(data):
+    cherrypy.response.headers['Content-Type'] = 'application/json'
+    page = json.dumps(data, default=str).encode('utf-8')
+    return compress(page, negotiate_encoding())
+
+
 def make_anchor(line):
     time, nick = line
     return "{}.{}".format(str(time).replace(':', '.'), nick)
@@ -105,15 +344,20 @@ class ChannelPage:
 
     @cherrypy.expose
     def default(self, channel):
+        db = pmxbot.logging.Logger.store
+        render = functools.partial(self.render, channel)
+        return conditional(render, make_etag(channel, db.version()))
+
+    def render(self, channel):
         page = jenv.get_template('channel.html')
 
         db = pmxbot.logging.Logger.store
         context = get_context()
-        contents = db.get_channel_days(channel)
+        contents = db.get_channel_day_counts(channel)
         months = {}
         for fn in sorted(contents, reverse=True):
             mon_des, day = fn.rsplit('-', 1)
-            months.setdefault(pmon(mon_des), []).append((pday(fn), fn))
+            months.setdefault(pmon(mon_des), []).append((pday(fn), fn, contents[fn]))
         context['months'] = sorted(months.items(), key=self.by_date, reverse=True)
         context['channel'] = channel
         return page.render(**context).encode('utf-8')
@@ -138,32 +382,110 @@ class ChannelPage:
         return year, month_ord
 
 
+class DayRows:
+    """
+    The lines of a day, escaped and colored as they are rendered,
+    stopping at the first hour after limit lines (if any), from which
+    ``next`` is then the time.
+    """
+
+    def __init__(self, day_logs, limit=None):
+        self.day_logs = day_logs
+        self.limit = limit
+        self.color_map = {}
+        self.colors = colors[:]
+        self.next = None
+
+    def __iter__(self):
+        last_hour = None
+        for count, (tm, nick, msg) in enumerate(self.day_logs):
+            hour = str(tm)[:2]
+            if self.limit and count >= self.limit and hour != last_hour:
+                self.next = f'{hour}:00'
+                return
+            last_hour = hour
+            if nick not in self.color_map:
+                self.color_map[nick] = self.colors.pop(0) if self.colors else '000'
+            yield tm, nick, make_anchor((tm, nick)), html.escape(msg)
+
+
 class DayPage:
+    max_age = 365 * 24 * 60 * 60
+    "Past days are immutable, and cached by clients for this long."
+
+    page_size = 5000
+    """
+    Lines of a day rendered in the page, after which the page loads
+    the rest an hour at a time.
+    """
+
+    time_pattern = re.compile(r'\d{2}:\d{2}(:\d{2})?$')
+    day_pattern = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+    @classmethod
+    def parse_day(cls, value):
+        """
+        The date of a day given as YYYY-MM-DD.
+        """
+        with contextlib.suppress(ValueError):
+            if cls.day_pattern.match(value):
+                return datetime.date.fromisoformat(value)
+        raise cherrypy.HTTPError(400, "Days must be YYYY-MM-DD")
+
     @cherrypy.expose
-    def default(self, channel, day):
+    @cherrypy.config(**{'response.stream': True})
+    def default(self, channel, day, format='html', **range):
+        """
+        The logs of channel on day, or only those from the time 'from'
+        and before the time 'to', as HTML or (with format=json) JSON.
+        """
+        date = self.parse_day(day)
+        start, end = map(self.parse_time, (range.get('from'), range.get('to')))
+        if format == 'json':
+            return self.render_json(channel, day, start, end)
+        render = functools.partial(self.render, channel, day, start, end)
+        if date < datetime.date.today() - datetime.timedelta(days=1):
+            end_ts = calendar.timegm((date + datetime.timedelta(days=1)).timetuple())
+            etag = make_etag(channel, day, start, end)
+            return conditional(render, etag, self.max_age, last_modified=end_ts)
+        db = pmxbot.logging.Logger.store
+        return conditional(render, make_etag(channel, day, start, end, db.version()))
+
+    @classmethod
+    def parse_time(cls, value):
+        if value and not cls.time_pattern.match(value):
+            raise cherrypy.HTTPError(400, "Times must be HH:MM or HH:MM:SS")
+        return value
+
+    def render(self, channel, day, start=None, end=None):
         page = jenv.get_template('day.html')
         db = pmxbot.logging.Logger.store
         context = get_context()
-        day_logs = db.get_day_logs(channel, day)
-        data = [(t, n, make_anchor((t, n)), html.escape(m)) for (t, n, m) in day_logs]
-        usernames = [x[1] for x in data]
-        color_map = {}
-        clrs = colors[:]
-        for u in usernames:
-            if u not in color_map:
-                try:
-                    color = clrs.pop(0)
-                except IndexError:
-                    color = "000"
-                color_map[u] = color
-        context['color_map'] = color_map
-        context['history'] = data
+        page_size = pmxbot.config.get('day page size', self.page_size)
+        limit = None if start or end else page_size
+        rows = DayRows(db.get_day_logs(channel, day, start, end), limit)
+        context['color_map'] = rows.color_map
+        context['history'] = rows
         context['channel'] = channel
         context['pdate'] = "{pday} of {days}".format(
             pday=pday(day), days=pmon(day.rsplit('-', 1)[0])
         )
         return page.render(**context).encode('utf-8')
 
+    def render_json(self, channel, day, start, end):
+        cherrypy.response.headers['Content-Type'] = 'application/json'
+        db = pmxbot.logging.Logger.store
+        lines = db.get_day_logs(channel, day, start, end)
+        return compress_stream(self._json_chunks(lines))
+
+    @staticmethod
+    def _json_chunks(lines):
+        yield b'['
+        for count, (tm, nick, msg) in enumerate(lines):
+            line = dict(time=str(tm), nick=nick, message=msg)
+            yield (',' if count else '').encode() + json.dumps(line).encode('utf-8')
+        yield b']'
+
 
 class KarmaPage:
     @cherrypy.expose
@@ -176,9 +498,10 @@ class KarmaPage:
             context['lookup'] = self.karma_comma(karma.search(term)) or [
                 ('NO RESULTS FOUND', '')
             ]
+        context['trending'] = self.karma_comma(karma.trending(select=20))
         context['top100'] = self.karma_comma(karma.list(select=100))
         context['bottom100'] = self.karma_comma(karma.list(select=-100))
-        return page.render(**context).encode('utf-8')
+        return compress(page.render(**context).encode('utf-8'), negotiate_encoding())
 
     @staticmethod
     def karma_comma(karma_results):
@@ -192,31 +515,37 @@ class KarmaPage:
 
 
 class SearchPage:
+    page_size = 50
+
     @cherrypy.expose
-    def default(self, term=''):
+    @cherrypy.config(**{'response.stream': True})
+    def default(self, term='', before=None, limit=None):
         page = jenv.get_template('search.html')
         context = get_context()
-        db = pmxbot.logging.Logger.store
-
-        # a hack to enable the database to create anchors when building search
-        #  results
-        db.make_anchor = make_anchor
 
         if not term:
             raise cherrypy.HTTPRedirect(cherrypy.request.base)
         terms = term.strip().split()
-        results = sorted(db.search(*terms), key=lambda x: x[1], reverse=True)
+        page_size = pmxbot.config.get('search page size', self.page_size)
+        limit = int_param('limit', limit or page_size)
+        results, next = search_page(terms, before, limit)
         context['search_results'] = results
         context['num_results'] = len(results)
         context['term'] = term
-        return page.render(**context).encode('utf-8')
+        if next:
+            query = dict(term=term, before=next, limit=limit)
+            context['next'] = '?' + urllib.parse.urlencode(query)
+        return compress_stream(
+            chunk.encode('utf-8') for chunk in page.generate(**context)
+        )
 
 
 class HelpPage:
     @cherrypy.expose
     def default(self):
         page = jenv.get_template('help.html')
-        return page.render(**self.get_context()).encode('utf-8')
+        page = page.render(**self.get_context()).encode('utf-8')
+        return compress(page, negotiate_encoding())
 
     @staticmethod
     @functools.lru_cache
@@ -284,6 +613,115 @@ class LegacyPage:
         raise cherrypy.HTTPRedirect(url, 301)
 
 
+class ApiPage:
+    """
+    Read-only JSON access to the logs and karma.
+    """
+
+    @cherrypy.expose
+    def channels(self):
+        "The channels logged, with the last message in each."
+        last_messages = pmxbot.logging.Logger.store.last_messages()
+        return json_response([
+            dict(channel=channel, **last_messages[channel])
+            for channel in sorted(last_messages, key=str.lower)
+        ])
+
+    @cherrypy.expose
+    def channel(self, channel):
+        "The days logged in channel, with the number of messages on each."
+        counts = pmxbot.logging.Logger.store.get_channel_day_counts(channel)
+        return json_response([
+            dict(day=day, messages=counts[day]) for day in sorted(counts)
+        ])
+
+    @cherrypy.expose
+    @cherrypy.config(**{'response.stream': True})
+    def day(self, channel, day, **range):
+        "The messages in channel on day, as the day page with format=json."
+        DayPage.parse_day(day)
+        start, end = map(DayPage.parse_time, (range.get('from'), range.get('to')))
+        return DayPage().render_json(channel, day, start, end)
+
+    @cherrypy.expose
+    @cherrypy.config(**{'response.stream': True})
+    def export(self, channel, start='', end=''):
+        """
+        The messages in channel on the days from start through end (each
+        YYYY-MM-DD), streamed as one JSON object per line.
+        """
+        for value in filter(None, (start, end)):
+            DayPage.parse_day(value)
+        db = pmxbot.logging.Logger.store
+        days = sorted(
+            day
+            for day in db.get_channel_days(channel)
+            if start <= day and (not end or day <= end)
+        )
+        cherrypy.response.headers['Content-Type'] = 'application/x-ndjson'
+        return compress_stream(self._export_lines(db, channel, days))
+
+    @staticmethod
+    def _export_lines(db, channel, days):
+        for day in days:
+            for tm, nick, msg in db.get_day_logs(channel, day):
+                line = dict(day=day, time=str(tm), nick=nick, message=msg)
+                yield json.dumps(line).encode('utf-8') + b'\n'
+
+    @cherrypy.expose
+    def search(self, term, before=None, limit=None):
+        """
+        A page of search results, most recent first, with the cursor
+        for the next page.
+        """
+        limit = limit and int_param('limit', limit)
+        results, next = search_page(term.split(), before, limit)
+        return json_response(
+            dict(
+                results=[
+                    dict(
+                        channel=channel,
+                        date=date,
+                        marker=marker,
+                        lines=[
+                            dict(time=str(tm), nick=nick, **search_line(msg))
+                            for tm, nick, msg in lines
+                        ],
+                    )
+                    for channel, date, marker, lines in results
+                ],
+                next=next,
+            )
+        )
+
+    @cherrypy.expose
+    def karma(self, term='', select='100', limit='100'):
+        """
+        The karma of up to limit things matching term, or else the
+        select highest (or if negative, lowest).
+        """
+        karma = pmxbot.karma.Karma.store
+        term = term.strip()
+        if term:
+            items = karma.search(term, limit=int_param('limit', limit))
+        else:
+            items = karma.list(select=int_param('select', select))
+        return json_response([dict(names=names, value=value) for names, value in items])
+
+    @cherrypy.expose
+    def trending(self, days='7', select='10'):
+        """
+        The select things whose karma rose most (or if negative, fell
+        most) over the last days days.
+        """
+        karma = pmxbot.karma.Karma.store
+        days = int_param('days', days)
+        items = karma.trending(days=days, select=int_param('select', select))
+        return json_response([
+            dict(names=names, change=change) for names, change in items
+        ])
+
+
 class PmxbotPages:
     channel = ChannelPage()
     day = DayPage()
@@ -291,15 +729,23 @@ class PmxbotPages:
     search = SearchPage()
     help = HelpPage()
     legacy = LegacyPage()
+    api = ApiPage()
+    Autolinker_js = StaticAsset('Autolinker.js', 'application/javascript')
+    pmxbot_png = StaticAsset('pmxbot.png', 'image/png', compress=False)
 
     @cherrypy.expose
     def default(self):
+        db = pmxbot.logging.Logger.store
+        return conditional(self.render, make_etag(db.version()))
+
+    def render(self):
         page = jenv.get_template('index.html')
         db = pmxbot.logging.Logger.store
         context = get_context()
         chans = []
-        for chan in sorted(db.list_channels(), key=str.lower):
-            last = db.last_message(chan)
+        last_messages = db.last_messages()
+        for chan in sorted(last_messages, key=str.lower):
+            last = last_messages[chan]
             summary = [
                 chan,
                 last['datetime'].strftime("%Y-%m-%d %H:%M"),
@@ -348,51 +794,65 @@ def init_config(config={}):
     return config
 
 
-def resolve_file(mgr, filename):
+def server_config(config):
     """
-    Given a file manager (ExitStack), load the filename
-    and set the exit stack to clean up. See
-    https://importlib-resources.readthedocs.io/en/latest/migration.html#pkg-resources-resource-filename
-    for more details.
+    The global CherryPy config for serving the viewer from this process.
     """
-    path = resources.files('pmxbot.web.templates') / filename
-    return str(mgr.enter_context(resources.as_file(path)))
+    return {
+        'server.socket_port': config.port,
+        'server.socket_host': config.host,
+        'server.thread_pool': config.get('web threads', 10),
+        'server.environment': 'production',
+        'engine.autoreload.on': False,
+    }
 
 
-def startup(config):
+def app_config():
+    """
+    The CherryPy config for the viewer application, applied wherever
+    it is served (the global config applies only to CherryPy's server).
+    """
+    return {
+        '/': {
+            'request.show_tracebacks': False,
+            # 'tools.encode.on': True,
+            'tools.encode.encoding': 'utf-8',
+        },
+    }
+
+
+def make_app(config):
+    """
+    Initialize the viewer from config (a mapping or the filename of
+    a YAML config) and return it as a WSGI application.
+
+    Each process serving the viewer must call this itself, as it
+    opens the stores. Under a pre-forking server, call it in each
+    worker after the fork (i.e. don't preload the app), for example::
+
+        gunicorn --workers 4 --threads 10 \\
+            'pmxbot.web.viewer:make_app("config.yaml")'
+    """
+    if isinstance(config, str):
+        config = pmxbot.dictlib.ConfigDict.from_yaml(config)
+
     patch_compat(config)
 
     config = init_config(config)
 
+    page_cache.size = config.get('web cache size', page_cache.size)
+
     _setup_logging()
 
     pmxbot.core._load_library_extensions()
 
-    file_manager = contextlib.ExitStack()
-    static = functools.partial(resolve_file, file_manager)
+    return cherrypy.tree.mount(PmxbotPages(), config.web_base, app_config())
 
-    # Cherrypy configuration here
-    app_conf = {
-        'global': {
-            'server.socket_port': config.port,
-            'server.socket_host': config.host,
-            'server.environment': 'production',
-            'engine.autoreload.on': False,
-            # 'tools.encode.on': True,
-            'tools.encode.encoding': 'utf-8',
-        },
-        '/pmxbot.png': {
-            'tools.staticfile.on': True,
-            'tools.staticfile.filename': static('pmxbot.png'),
-        },
-        '/Autolinker.js': {
-            'tools.staticfile.on': True,
-            'tools.staticfile.filename': static('Autolinker.js'),
-        },
-    }
 
-    with file_manager:
-        cherrypy.quickstart(PmxbotPages(), config.web_base, config=app_conf)
+def startup(config):
+    app = make_app(config)
+    config = pmxbot.config
+    cherrypy.quickstart(app, config.web_base, {'global': server_config(config)})
 
 
 def run():
@@ -2,6 +2,7 @@ import os
 
 import pytest
 
+import pmxbot.logging
 import pmxbot.util
 
 
@@ -17,3 +18,13 @@ def google_api_key(monkeypatch):
     if not key:
         pytest.skip("Need GOOGLE_API_KEY environment variable")
     monkeypatch.setitem(pmxbot.config, 'Google API key', key)
+
+
+@pytest.fixture
+def logger(tmp_path):
+    """
+    A logger on a fresh SQLite database, closed after the test.
+    """
+    logger = pmxbot.logging.Logger.from_URI(f'sqlite:{tmp_path / "logs.sqlite"}')
+    yield logger
+    logger.close()
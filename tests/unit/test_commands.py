@@ -322,6 +322,16 @@ class TestCommands:
         res = karma.karma(nick="testrunner", rest=id)
         assert re.match(r"^%s has 2 karmas$" % id, res)
 
+    def test_karma_trending(self):
+        """
+        Things gaining karma are trending.
+        """
+        id = str(uuid.uuid4())
+        for _ in range(100):
+            karma.karma(nick="testrunner", rest="%s++" % id)
+        res = karma.karma(nick="testrunner", rest="trending 2")
+        assert res.startswith("Trending over 2 days: (%s: +100)" % id)
+
     def test_karma_set_and_check_with_space(self):
         """
         Take a new entity that has a space in it's name, give it some karma,
@@ -1,10 +1,26 @@
+import asyncio
 import datetime
 import copy
+import threading
+import time
 
 import pytest
 from tempora.schedule import DelayedCommand, now
 
-from pmxbot.core import AtHandler, Handler, Scheduled, command, initialize
+from pmxbot.core import (
+    AtHandler,
+    Bot,
+    CommandHandler,
+    ContentHandler,
+    Handler,
+    HandlerPool,
+    Scheduled,
+    collect_async,
+    command,
+    contains,
+    initialize,
+    regexp,
+)
 from pmxbot.dictlib import ConfigDict
 from pmxbot import irc
 from pmxbot import slack
@@ -205,6 +221,265 @@ class TestCommandHandlerUniqueness:
         assert len(Handler._registry) == 2
 
 
+@pytest.mark.usefixtures("patch_handler_registry")
+class TestFindMatching:
+    def linear_scan(self, cls, message, channel):
+        return [
+            handler
+            for handler in Handler._registry
+            if isinstance(handler, cls) and handler.match(message, channel)
+        ]
+
+    @pytest.fixture
+    def handlers(self):
+        ContentHandler(channels=['#logged']).decorate(lambda: None)
+        command(name='foo', aliases=('fo', 'f'))(lambda: None)
+        command(name='bar')(lambda: None)
+        contains('foo')(lambda: None)
+        contains('f', priority=2)(lambda: None)
+        contains('now', channels=['#logged'])(lambda: None)
+        contains('no', exclude=['#logged'])(lambda: None)
+
+    @pytest.mark.usefixtures("handlers")
+    @pytest.mark.parametrize(
+        'message',
+        ['!foo now', '!FO', '!f', '!bar', 'FOO', '!foobar', '', 'nothing', 'No'],
+    )
+    @pytest.mark.parametrize('channel', ['#logged', '#other'])
+    def test_matches_linear_scan(self, message, channel):
+        for cls in Handler, ContentHandler, CommandHandler:
+            expected = self.linear_scan(cls, message, channel)
+            assert list(cls.find_matching(message, channel)) == expected
+
+    def test_index_tracks_registration(self):
+        assert not list(Handler.find_matching('!late', None))
+
+        @command()
+        def late():
+            "registered after the index was built"
+
+        (handler,) = Handler.find_matching('!late', None)
+        assert handler.func is late
+
+    def test_overridden_match_scanned(self):
+        class Greeting(CommandHandler):
+            def match(self, message, channel):
+                return message.lower().startswith(('hi', 'hello'))
+
+        Greeting(name='greet', doc='Say hi').decorate(lambda: None)
+        (handler,) = Handler.find_matching('hello there', '#chan')
+        assert isinstance(handler, Greeting)
+
+
+class RecordingBot(Bot):
+    _nickname = 'recorder'
+
+    def __init__(self):
+        self.sent = []
+
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def transmit(self, channel, message):
+        self.sent.append((channel, message))
+        return message
+
+
+class CountingPattern:
+    """
+    Wrap a compiled pattern, counting the searches performed.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.searches = 0
+
+    def search(self, message):
+        self.searches += 1
+        return self.pattern.search(message)
+
+
+@pytest.mark.usefixtures("patch_handler_registry")
+class TestRegexpDispatch:
+    def test_match_reused(self):
+        @regexp('ticket', r'#(?P<number>\d+)')
+        def ticket(match):
+            return f"ticket {match.group('number')}"
+
+        (handler,) = Handler._registry
+        handler.pattern = CountingPattern(handler.pattern)
+        bot = RecordingBot()
+        bot.handle_action('#chan', 'nick', 'see #42')
+        assert bot.sent == [('#chan', 'ticket 42')]
+        assert handler.pattern.searches == 1
+
+
+@pytest.mark.usefixtures("patch_handler_registry")
+class TestAsyncHandlers:
+    def test_coroutine(self):
+        @command()
+        async def later(rest):
+            await asyncio.sleep(0)
+            return f'later {rest}'
+
+        bot = RecordingBot()
+        bot.handle_action('#chan', 'nick', '!later today')
+        assert bot.sent == [('#chan', 'later today')]
+
+    def test_async_generator(self):
+        @command()
+        async def count():
+            for n in range(3):
+                await asyncio.sleep(0)
+                yield str(n)
+
+        bot = RecordingBot()
+        bot.handle_action('#chan', 'nick', '!count')
+        assert bot.sent == [('#chan', '0'), ('#chan', '1'), ('#chan', '2')]
+
+    def test_exception(self):
+        @command()
+        async def fail():
+            raise ValueError("no good")
+
+        bot = RecordingBot()
+        bot.handle_action('#chan', 'nick', '!fail')
+        assert 'no good' in bot.sent[0][1]
+
+    def test_pooled(self):
+        @command()
+        async def later(rest):
+            await asyncio.sleep(0)
+            return f'later {rest}'
+
+        @command()
+        async def fail():
+            raise ValueError("no good")
+
+        bot = RecordingBot()
+        bot._handler_pool = HandlerPool(1)
+        bot.handle_action('#chan', 'nick', '!later today')
+        bot.handle_action('#chan', 'nick', '!fail')
+        deadline = time.monotonic() + 5
+        while len(bot.sent) < 3 and time.monotonic() < deadline:
+            bot._deliver_pooled()
+            time.sleep(0.01)
+        assert bot.sent[0] == ('#chan', 'later today')
+        assert 'no good' in bot.sent[1][1]
+        bot._handler_pool.shutdown()
+
+
+class TestHandlerPool:
+    @pytest.fixture
+    def release(self):
+        release = threading.Event()
+        yield release
+        release.set()
+
+    @staticmethod
+    def blocked(release, message):
+        release.wait()
+        yield message
+
+    @staticmethod
+    def collect(pool, count, timeout=5):
+        delivered = []
+        deadline = time.monotonic() + timeout
+        while len(delivered) < count and time.monotonic() < deadline:
+            delivered.extend(pool.ready())
+            time.sleep(0.01)
+        return delivered
+
+    def test_ordered_per_channel(self, release):
+        pool = HandlerPool(4)
+        pool.submit('#a', self.blocked(release, 'first'), None)
+        pool.submit('#a', iter(['second']), None)
+        pool.submit('#b', iter(['other']), None)
+        assert self.collect(pool, 1) == [('#b', ['other'])]
+        release.set()
+        assert self.collect(pool, 2) == [('#a', ['first']), ('#a', ['second'])]
+        pool.shutdown()
+
+    def test_timeout(self, release):
+        pool = HandlerPool(2, timeout=0.01)
+        pool.submit('#a', self.blocked(release, 'late'), lambda: ['timed out'])
+        pool.submit('#a', iter(['next']), None)
+        time.sleep(0.05)
+        assert self.collect(pool, 2) == [('#a', ['timed out']), ('#a', ['next'])]
+        release.set()
+        assert self.collect(pool, 1, timeout=0.1) == []
+        pool.shutdown()
+
+    def test_timeout_from_start(self, release):
+        """
+        A handler waiting for a worker is not timed out, but runs
+        once a worker is free.
+        """
+        pool = HandlerPool(1, timeout=0.1)
+        pool.submit('#a', self.blocked(release, 'late'), lambda: ['timed out'])
+        pool.submit('#b', self.blocked(release, 'waited'), lambda: ['timed out'])
+        time.sleep(0.15)
+        assert self.collect(pool, 1) == [('#a', ['timed out'])]
+        release.set()
+        assert self.collect(pool, 1) == [('#b', ['waited'])]
+        pool.shutdown()
+
+    def test_abandoned_workers_replaced(self, release):
+        pool = HandlerPool(2, timeout=0.05)
+        pool.submit('#a', self.blocked(release, 'stuck'), lambda: ['timed out'])
+        pool.submit('#b', self.blocked(release, 'stuck'), lambda: ['timed out'])
+        pool.submit('#c', iter(['served']), lambda: ['timed out'])
+        delivered = self.collect(pool, 3)
+        assert sorted(delivered) == [
+            ('#a', ['timed out']),
+            ('#b', ['timed out']),
+            ('#c', ['served']),
+        ]
+        pool.shutdown()
+
+    def test_async_without_worker(self, release):
+        """
+        Asynchronous handlers are awaited concurrently, without
+        occupying a worker.
+        """
+
+        async def later(message):
+            await asyncio.sleep(0.1)
+            return message
+
+        pool = HandlerPool(1)
+        pool.submit('#a', self.blocked(release, 'blocked'), None)
+        pool.submit('#b', collect_async(lambda: later('one'), None), None)
+        pool.submit('#c', collect_async(lambda: later('two'), None), None)
+        assert sorted(self.collect(pool, 2, timeout=0.15)) == [
+            ('#b', ['one']),
+            ('#c', ['two']),
+        ]
+        release.set()
+        assert self.collect(pool, 1) == [('#a', ['blocked'])]
+        pool.shutdown()
+
+    def test_async_timeout_cancels(self):
+        cancelled = threading.Event()
+
+        async def forever():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        pool = HandlerPool(1, timeout=0.05)
+        pool.submit('#a', collect_async(forever, None), lambda: ['timed out'])
+        assert self.collect(pool, 1) == [('#a', ['timed out'])]
+        assert cancelled.wait(1)
+        pool.shutdown()
+
+    def test_not_configured(self):
+        assert not HandlerPool.from_config({})
+
+
 @pytest.mark.usefixtures("patch_scheduled_registry")
 class TestScheduledHandlerUniqueness:
     @pytest.fixture
@@ -16,3 +16,16 @@ def test_contains_rate_limit():
     handler = core.ContainsHandler(name='#', func=None, rate=0.5)
     results = {handler.match('Tell me about #foo', channel='bar') for x in range(1000)}
     assert True in results and False in results
+
+
+def test_attach_binds_accepted_parameters():
+    """
+    Only the parameters accepted by the handler function are supplied.
+    """
+
+    def func(channel, rest):
+        return channel, rest
+
+    handler = core.ContainsHandler(name='foo', func=func)
+    params = dict(channel='#bar', nick='baz', rest='foo bar', event=None)
+    assert handler.attach(params)() == ('#bar', 'foo bar')
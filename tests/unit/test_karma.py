@@ -1,6 +1,11 @@
+import datetime
+import threading
+
 import pytest
 
+import pmxbot
 from pmxbot import karma
+from pmxbot.core import FinalRegistry
 
 
 class TestMongoDBKarma:
@@ -90,3 +95,161 @@ class TestSQLiteKarma:
         with pytest.raises(karma.AlreadyLinked):
             k.link('bar', 'foo')
         assert k.lookup('foo') == k.lookup('bar') == 100
+
+    def test_concurrent_changes(self, sqlite_karma):
+        """
+        Changes to a new thing from many threads are all counted.
+        """
+        k = sqlite_karma
+
+        def increment():
+            for _ in range(20):
+                k.change('foo', 1)
+
+        threads = [threading.Thread(target=increment) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert k.lookup('foo') == 100
+        assert len(k.list()) == 1
+
+    def test_write_back(self, sqlite_karma, monkeypatch):
+        """
+        With a write interval, changes are coalesced into one write
+        per thing, and lookups see the pending changes.
+        """
+        k = sqlite_karma
+        monkeypatch.setitem(pmxbot.config, 'karma write interval', 60)
+        monkeypatch.setitem(pmxbot.config, 'karma write cache size', 2)
+        k.init_writer()
+        writes = []
+        change = k._change
+        monkeypatch.setattr(k, '_change', lambda *args: writes.append(args))
+        k.change('foo', 1)
+        k.change('Foo', 1)
+        k.change('bar', -1)
+        assert writes == []
+        k.change('baz', 1)
+        assert writes == [('foo', 2)]
+        monkeypatch.setattr(k, '_change', change)
+        k.change('bar', -1)
+        assert k.lookup('bar') == -2
+        k.close()
+        assert k.writer.pending == {}
+
+    def test_written_at_exit(self, tmp_path, monkeypatch):
+        monkeypatch.setitem(pmxbot.config, 'database', f'sqlite:{tmp_path / "db"}')
+        monkeypatch.setitem(pmxbot.config, 'karma write interval', 60)
+        monkeypatch.setattr(FinalRegistry, '_finalizers', [])
+        monkeypatch.setattr(karma.Karma, '_finalizers', [])
+        karma.Karma.initialize()
+        k = karma.Karma.store
+        k.change('foo', 1)
+        FinalRegistry.finalize()
+        assert k.writer.pending == {}
+        assert k.db.execute('SELECT karmavalue FROM karma_values').fetchall() == [(1,)]
+        karma.Karma.finalize()
+
+    def test_list(self, sqlite_karma):
+        k = sqlite_karma
+        k.set('foo', 3)
+        k.set('bar', 1)
+        k.set('baz', -2)
+        k.set('foo, the elder', 1)
+        k.link('foo', 'foo, the elder')
+        assert k.list(1) == [(['foo', 'foo, the elder'], 4)]
+        assert k.list(-2) == [(['bar'], 1), (['baz'], -2)]
+        assert [value for keys, value in k.list()] == [4, 1, -2]
+
+    def test_leaderboard(self, sqlite_karma, monkeypatch):
+        """
+        The leaderboard follows changes without reading the rankings
+        again, and agrees with the database.
+        """
+        k = sqlite_karma
+        monkeypatch.setitem(pmxbot.config, 'karma leaderboard size', 2)
+        for value, thing in enumerate(['a', 'b', 'c', 'd']):
+            k.set(thing, value * 10)
+        k.init_leaderboard()
+        monkeypatch.setattr(k.leaderboard, '_load', None)
+        k.change('a', -5)
+        k.change('e', 35)
+        k.change('b', -20)
+        assert k.list(2) == k._list(2) == [(['e'], 35), (['d'], 30)]
+        assert k.list(-2) == k._list(-2) == [(['a'], -5), (['b'], -10)]
+
+    def test_leaderboard_reloads(self, sqlite_karma, monkeypatch):
+        """
+        When an entry falls off the board, the board is reloaded.
+        """
+        k = sqlite_karma
+        monkeypatch.setitem(pmxbot.config, 'karma leaderboard size', 2)
+        for value, thing in enumerate(['a', 'b', 'c', 'd']):
+            k.set(thing, value * 10)
+        k.init_leaderboard()
+        k.change('d', -25)
+        assert k.list(2) == [(['c'], 20), (['b'], 10)]
+        k.link('a', 'b')
+        assert k.list(1) == [(['c'], 20)]
+        assert k.list(-1) == [(['d'], 5)]
+
+    def test_search(self, sqlite_karma):
+        k = sqlite_karma
+        k.set('pmxbot', 5)
+        k.set('the pmx team', 10)
+        k.set('100%', 1)
+        k.set('px', 2)
+        k.link('px', 'jaraco')
+        assert k.search('PMX') == [(['the pmx team'], 10), (['pmxbot'], 5)]
+        assert k.search('pmx', limit=1) == [(['the pmx team'], 10)]
+        assert k.search('pmx*') == [(['pmxbot'], 5)]
+        assert k.search('0%') == [(['100%'], 1)]
+        assert k.search('jar') == [(['px', 'jaraco'], 2)]
+        assert k.search('x') == [
+            (['the pmx team'], 10),
+            (['pmxbot'], 5),
+            (['px', 'jaraco'], 2),
+        ]
+        assert len(k.search('*')) == 4
+        assert k.search('nothing') == []
+
+    def test_trending(self, sqlite_karma, monkeypatch):
+        k = sqlite_karma
+        k.change('foo', 3)
+        k.change('foo', -1)
+        k.change('bar', 1)
+        k.change('baz', -2)
+        k.set('qux', 50)
+        k.link('bar', 'baz|away')
+        k.change('baz|away', 4)
+        assert k.trending() == [(['bar', 'baz|away'], 5), (['foo'], 2)]
+        assert k.trending(select=-1) == [(['baz'], -2)]
+        query = "SELECT change, changes FROM karma_days WHERE karmakey = 'foo'"
+        assert k.db.execute(query).fetchall() == [(2, 2)]
+
+        old = datetime.datetime.now() - datetime.timedelta(days=60)
+        k.db.execute('UPDATE karma_changes SET datetime = ?', [old])
+        k.db.execute('UPDATE karma_days SET day = ?', [old.date().isoformat()])
+        assert k.trending() == []
+        assert k.trending(days=61)[0] == (['bar', 'baz|away'], 5)
+        monkeypatch.setitem(pmxbot.config, 'karma history days', 0)
+        k.compact_history()
+        assert not k.db.execute('SELECT * FROM karma_changes').fetchall()
+        assert k.db.execute('SELECT * FROM karma_days').fetchall()
+
+    def test_trending_over_days(self, sqlite_karma):
+        """
+        Trends are the sum over the days, even where the days differ
+        in sign.
+        """
+        k = sqlite_karma
+        k.change('a', 5)
+        k.change('b', -3)
+        k.flush()
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        k.db.execute('UPDATE karma_days SET day = ?', [yesterday.isoformat()])
+        k.change('a', -10)
+        k.change('b', 8)
+        assert k.trending() == [(['b'], 5)]
+        assert k.trending(select=-10) == [(['a'], -5)]
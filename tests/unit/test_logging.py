@@ -1,5 +1,6 @@
 import pytest
 
+import pmxbot
 from pmxbot import logging
 
 
@@ -62,3 +63,180 @@ class TestMongoDBLogging:
         assert anchor == 'anchor'
         assert nick == 'joe'
         assert text == 'who da foo?'
+
+
+class TestSQLiteBatchLogging:
+    @pytest.fixture(autouse=True)
+    def batch_config(self, monkeypatch):
+        monkeypatch.setitem(pmxbot.config, 'log batch size', 3)
+        monkeypatch.setitem(pmxbot.config, 'log batch interval', 60)
+
+    def count(self, logger):
+        return logger.db.execute('select count(*) from logs').fetchone()[0]
+
+    def test_written_in_batches(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.message('#inane', 'nik', 'message two')
+        assert self.count(logger) == 0
+        logger.message('#inane', 'nik', 'message three')
+        logger.flush()
+        assert self.count(logger) == 3
+
+    def test_reads_see_pending(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        assert logger.last_seen('nik')
+
+    def test_written_on_close(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        writer = logger.writer
+        logger.close()
+        assert not writer.is_alive()
+        logger.__init__(logger.uri)
+        assert self.count(logger) == 1
+
+    def test_shared_writer(self, logger):
+        other = logging.Logger.from_URI(logger.uri)
+        assert other.writer is logger.writer
+        other.message('#inane', 'nik', 'message one')
+        other.close()
+        assert logger.writer.is_alive()
+        logger.message('#inane', 'nik', 'message two')
+        logger.flush()
+        assert self.count(logger) == 2
+
+    def test_stopped_writer(self, logger):
+        writer = logger.writer
+        logger.close()
+        with pytest.raises(RuntimeError):
+            writer.flush()
+        with pytest.raises(RuntimeError):
+            writer.put(['now', '#inane', 'nik', 'message'])
+        logger.__init__(logger.uri)
+
+
+def hi(term):
+    return f'{logging.HIGHLIGHT_START}{term}{logging.HIGHLIGHT_END}'
+
+
+class TestSQLiteSearch:
+    @pytest.fixture
+    def logger(self, logger):
+        logger.make_anchor = repr
+        logger.message('#inane', 'nik', 'the quick brown fox')
+        logger.message('#inane', 'nak', 'jumped over')
+        logger.message('#inane', 'nik', 'the lazy dog')
+        logger.message('#other', 'nok', '100% of foxes')
+        return logger
+
+    def messages(self, results):
+        return [line[2] for channel, date, marker, lines in results for line in lines]
+
+    def test_fulltext(self, logger):
+        results = logger.search('lazy', 'dog')
+        assert len(results) == 1
+        assert f'the {hi("lazy")} {hi("dog")}' in self.messages(results)
+        assert 'jumped over' in self.messages(results)
+
+    def test_overlapping_context_merged(self, logger):
+        (result,) = logger.search('the')
+        assert self.messages([result]) == [
+            f'{hi("the")} quick brown fox',
+            'jumped over',
+            f'{hi("the")} lazy dog',
+        ]
+
+    def test_paged(self, logger):
+        results, next = logger.search_page(['the'], limit=1)
+        assert self.messages(results)[-1] == f'{hi("the")} lazy dog'
+        results, next = logger.search_page(['the'], before=next, limit=1)
+        assert self.messages(results)[0] == f'{hi("the")} quick brown fox'
+        assert next is None
+
+    def test_paged_without_fulltext(self, logger, monkeypatch):
+        monkeypatch.setattr(logger, '_has_fulltext', lambda: False)
+        results, next = logger.search_page(['fox'], limit=1)
+        assert self.messages(results) == ['100% of foxes']
+        results, next = logger.search_page(['fox'], before=next)
+        assert self.messages(results)[0] == 'the quick brown fox'
+        assert next is None
+
+    def test_fulltext_removed(self, logger):
+        logger.strike('#inane', 'nik', 0)
+        assert not logger.search('lazy')
+
+    def test_indexed_when_created(self, logger):
+        logger.flush()
+        for name in 'insert', 'delete', 'update':
+            logger.db.execute(f'DROP TRIGGER logs_fts_{name}')
+        logger.db.execute('DROP TABLE logs_fts')
+        logger.init_tables()
+        assert logger.search('lazy')
+
+    def test_rebuild(self, logger):
+        logger.db.execute("INSERT INTO logs_fts (logs_fts) VALUES ('delete-all')")
+        assert not logger.search('lazy')
+        logger.rebuild_fulltext()
+        assert logger.search('lazy')
+
+    def test_without_fulltext(self, logger, monkeypatch):
+        monkeypatch.setattr(logger, '_has_fulltext', lambda: False)
+        assert len(logger.search('fox')) == 2
+        assert len(logger.search('100%')) == 1
+        assert not logger.search('1_0')
+
+
+class TestSQLiteChannelDays:
+    def test_maintained(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.message('#inane', 'nik', 'message two')
+        logger.message('#other', 'nik', 'message three')
+        (day,) = logger.get_channel_days('inane')
+        assert logger.get_channel_day_counts('inane') == {day: 2}
+        logger.strike('inane', 'nik', 0)
+        assert logger.get_channel_day_counts('inane') == {day: 1}
+        logger.clear()
+        assert logger.get_channel_days('inane') == []
+
+    def test_rebuild(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.db.execute('DELETE FROM channel_days')
+        assert logger.get_channel_days('inane') == []
+        logger.rebuild_channel_days()
+        assert len(logger.get_channel_days('inane')) == 1
+
+    def test_filled_when_created(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.message('#inane', 'nik', 'message two')
+        logger.flush()
+        logger.db.execute('DROP TABLE channel_days')
+        logger.init_tables()
+        (day,) = logger.get_channel_days('inane')
+        assert logger.get_channel_day_counts('inane') == {day: 2}
+
+
+class TestSQLiteRecent:
+    def test_maintained(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.message('#inane', 'nak', 'message two')
+        logger.message('#other', 'nik', 'message three')
+        assert sorted(logger.list_channels()) == ['inane', 'other']
+        assert logger.last_message('inane')['message'] == 'message two'
+        logger.strike('inane', 'nak', 0)
+        assert logger.last_messages()['inane']['message'] == 'message one'
+        logger.clear()
+        assert logger.last_messages() == {}
+
+    def test_rebuild(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.message('#inane', 'nik', 'message two')
+        logger.db.execute('DELETE FROM recent')
+        logger.rebuild_recent()
+        assert logger.last_message('inane')['message'] == 'message two'
+
+    def test_filled_when_created(self, logger):
+        logger.message('#inane', 'nik', 'message one')
+        logger.message('#inane', 'nik', 'message two')
+        logger.flush()
+        logger.db.execute('DROP TABLE recent')
+        logger.init_tables()
+        assert logger.last_message('inane')['message'] == 'message two'
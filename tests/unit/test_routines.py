@@ -0,0 +1,46 @@
+import importlib
+
+import pytest
+
+import pmxbot
+from pmxbot import logging
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """
+    A database logged before its summaries existed, to be rebuilt
+    by a routine run without the bot's config.
+    """
+    monkeypatch.delattr(pmxbot, 'config', raising=False)
+    filename = str(tmp_path / 'db.sqlite')
+    logger = logging.SQLiteLogger(filename)
+    logger.message('#inane', 'nik', 'first message')
+    logger.message('#other', 'nik', 'second message')
+    for table in 'channel_days', 'recent':
+        logger.db.execute(f'DELETE FROM {table}')
+    logger.db.execute("INSERT INTO logs_fts (logs_fts) VALUES ('delete-all')")
+    yield logger
+    logger.close()
+
+
+def run(name, monkeypatch, *args):
+    routine = importlib.import_module(f'pmxbot.routines.{name}')
+    monkeypatch.setattr('sys.argv', [name, *args])
+    routine.run()
+
+
+def test_rebuild_fulltext(database, monkeypatch):
+    run('rebuild-fulltext', monkeypatch, database.filename)
+    query = "SELECT rowid FROM logs_fts WHERE logs_fts MATCH 'second'"
+    assert len(database.db.execute(query).fetchall()) == 1
+
+
+def test_rebuild_channel_days(database, monkeypatch):
+    run('rebuild-channel-days', monkeypatch, database.filename)
+    assert len(database.get_channel_day_counts('inane')) == 1
+
+
+def test_rebuild_recent(database, monkeypatch):
+    run('rebuild-recent', monkeypatch, database.filename)
+    assert sorted(database.list_channels()) == ['inane', 'other']
@@ -1,5 +1,6 @@
 import pytest
 from unittest.mock import MagicMock, patch
+from tempora import schedule
 
 from pmxbot import slack
 
@@ -226,3 +227,11 @@ def test_cached_get_id_for_channel_name(slack_bot, slack_conversation_list):
     slack_bot.get_id_for_channel_name("#anything")
 
     slack.iter_cursor.assert_called_once()
+
+
+def test_scheduler_sleeps_until_next_due(slack_bot):
+    assert slack_bot._until_next_scheduled() == 1.0
+    slack_bot.scheduler.add(schedule.DelayedCommand.after(0.5, None))
+    assert 0 < slack_bot._until_next_scheduled() <= 0.5
+    slack_bot.scheduler.add(schedule.DelayedCommand.after(-1, None))
+    assert slack_bot._until_next_scheduled() == 0
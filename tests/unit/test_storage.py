@@ -0,0 +1,78 @@
+import threading
+
+import pytest
+
+import pmxbot
+from pmxbot import logging, rolls, storage
+
+
+class TestSQLiteStorage:
+    @pytest.fixture
+    def database(self, tmp_path):
+        return f'sqlite:{tmp_path / "db.sqlite"}'
+
+    def test_wal_by_default(self, database):
+        store = storage.SQLiteStorage(database)
+        (mode,) = store.db.execute('PRAGMA journal_mode').fetchone()
+        assert mode == 'wal'
+        store.close()
+
+    def test_configured_pragmas(self, database, monkeypatch):
+        params = dict(synchronous='normal', cache_size=-4000, w=1)
+        monkeypatch.setitem(pmxbot.config, 'database params', params)
+        store = storage.SQLiteStorage(database)
+        assert store.db.execute('PRAGMA synchronous').fetchone() == (1,)
+        assert store.db.execute('PRAGMA cache_size').fetchone() == (-4000,)
+        store.close()
+
+    def test_invalid_pragma(self, database, monkeypatch):
+        params = dict(journal_mode='wal; drop table logs')
+        monkeypatch.setitem(pmxbot.config, 'database params', params)
+        with pytest.raises(ValueError):
+            storage.SQLiteStorage(database)
+
+    def test_shared_connection(self, database, monkeypatch):
+        calls = []
+        monkeypatch.setattr(
+            storage.SQLiteStorage, 'init_tables', lambda self: calls.append(self)
+        )
+        first = storage.SQLiteStorage(database)
+        second = storage.SQLiteStorage(database)
+        assert first.db is second.db
+        assert len(calls) == 1
+        first.close()
+        assert second.db.execute('select 1').fetchone() == (1,)
+        second.close()
+        assert (
+            database.partition(':')[2] not in storage.SQLiteStorage.connections.stats()
+        )
+
+    def test_without_config(self, database, monkeypatch):
+        """
+        A store may be used outside the bot, without its config.
+        """
+        monkeypatch.delattr(pmxbot, 'config', raising=False)
+        logger = logging.SQLiteLogger(database)
+        logger.message('#inane', 'nik', 'a message')
+        assert logger.writer is None
+        assert list(logger.list_channels()) == ['inane']
+        logger.close()
+
+    def test_connection_per_thread(self, database):
+        store = storage.SQLiteStorage(database)
+        result = []
+        thread = threading.Thread(target=lambda: result.append(store.db))
+        thread.start()
+        thread.join()
+        assert result[0] is not store.db
+        store.close()
+
+
+class TestMongoDBStorage:
+    def test_shared_client(self):
+        pytest.importorskip('pymongo')
+        uri = 'mongodb://localhost:27017/pmxbot_test'
+        first = logging.MongoDBLogger._get_collection(uri)
+        second = rolls.MongoDBLogger._get_collection(uri)
+        assert first.database.client is second.database.client
+        assert (first.name, second.name) == ('logs', 'rolls')
@@ -1,3 +1,13 @@
+import gzip
+import json
+import wsgiref.util
+
+import cherrypy
+import pytest
+from cherrypy.lib import httputil
+
+import pmxbot.core
+import pmxbot.karma
 import pmxbot.web.viewer
 
 
@@ -7,3 +17,270 @@ def test_get_context():
     """
     pmxbot.web.viewer.init_config()
     assert isinstance(pmxbot.web.viewer.HelpPage.get_context(), dict)
+
+
+@pytest.fixture
+def logger(logger, monkeypatch):
+    pmxbot.web.viewer.init_config()
+    monkeypatch.setattr(pmxbot.logging.Logger, 'store', logger, raising=False)
+    return logger
+
+
+@pytest.fixture
+def request_(monkeypatch):
+    """
+    A fresh request and response, and an empty page cache.
+    """
+    local, remote = httputil.Host('127.0.0.1', 80), httputil.Host('127.0.0.1', 1)
+    request = cherrypy._cprequest.Request(local, remote)
+    request.headers = httputil.HeaderMap()
+    cherrypy.serving.load(request, cherrypy._cprequest.Response())
+    monkeypatch.setattr(pmxbot.web.viewer, 'page_cache', pmxbot.web.viewer.PageCache())
+    return request
+
+
+def test_search_paged(logger):
+    logger.message('#inane', 'nik', '<b>first</b> message')
+    logger.message('#inane', 'nik', 'second message')
+    page = pmxbot.web.viewer.SearchPage().default(term='message', limit='1')
+    text = b''.join(page).decode('utf-8')
+    assert '<span class="termhi">message</span>' in text
+    assert '&lt;b&gt;first' in text
+    assert '<b>' not in text
+    assert 'second' in text
+    assert 'Older results' in text
+    with pytest.raises(cherrypy.HTTPError) as exc:
+        pmxbot.web.viewer.SearchPage().default(term=' ')
+    assert exc.value.status == 400
+
+
+def test_channel_page_counts(logger, request_):
+    logger.message('#inane', 'nik', 'first message')
+    logger.message('#inane', 'nik', 'second message')
+    text = pmxbot.web.viewer.ChannelPage().default('inane').decode('utf-8')
+    assert '(2)' in text
+
+
+def test_index_page(logger, request_):
+    logger.message('#inane', 'nik', 'first message')
+    logger.message('#other', 'nik', 'second message')
+    text = pmxbot.web.viewer.PmxbotPages().default().decode('utf-8')
+    assert 'first message' in text
+    assert 'second message' in text
+
+
+def test_index_page_validated(logger, request_):
+    logger.message('#inane', 'nik', 'first message')
+    pmxbot.web.viewer.PmxbotPages().default()
+    etag = cherrypy.response.headers['ETag']
+    assert cherrypy.response.headers['Cache-Control'] == 'no-cache'
+    request_.headers['If-None-Match'] = etag
+    cherrypy.serving.load(request_, cherrypy._cprequest.Response())
+    with pytest.raises(cherrypy.HTTPRedirect) as redirect:
+        pmxbot.web.viewer.PmxbotPages().default()
+    assert redirect.value.status == 304
+    logger.message('#inane', 'nik', 'second message')
+    cherrypy.serving.load(request_, cherrypy._cprequest.Response())
+    assert b'second message' in pmxbot.web.viewer.PmxbotPages().default()
+
+
+def test_pages_validated_after_strike(logger, request_):
+    logger.message('#inane', 'nik', 'my password is hunter2')
+    (day,) = logger.get_channel_days('inane')
+
+    def pages():
+        cherrypy.serving.load(request_, cherrypy._cprequest.Response())
+        index = pmxbot.web.viewer.PmxbotPages().default()
+        cherrypy.serving.load(request_, cherrypy._cprequest.Response())
+        return index + pmxbot.web.viewer.DayPage().default('inane', day)
+
+    assert b'hunter2' in pages()
+    logger.strike('#inane', 'nik', 0)
+    logger.message('#inane', 'nak', 'oops')
+    text = pages()
+    assert b'hunter2' not in text
+    assert b'oops' in text
+
+
+def test_past_day_immutable(logger, request_):
+    pmxbot.web.viewer.DayPage().default('inane', '2020-01-01')
+    headers = cherrypy.response.headers
+    assert 'immutable' in headers['Cache-Control']
+    assert headers['Last-Modified'] == 'Thu, 02 Jan 2020 00:00:00 GMT'
+
+
+def test_page_cache_bounded():
+    cache = pmxbot.web.viewer.PageCache(size=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    cache.get('a')
+    cache.put('c', b'12345')
+    assert cache.get('b') is None
+    assert cache.get('a') == cache.get('c') == b'12345'
+    cache.put('d', b'12345678901')
+    assert cache.get('d') is None
+    assert cache.total == 10
+
+
+def test_negotiate_encoding(request_):
+    request_.headers['Accept-Encoding'] = 'deflate, gzip;q=0.5, br;q=0'
+    assert pmxbot.web.viewer.negotiate_encoding({'br': None, 'gzip': None}) == 'gzip'
+    request_.headers['Accept-Encoding'] = 'gzip, br'
+    assert pmxbot.web.viewer.negotiate_encoding({'br': None, 'gzip': None}) == 'br'
+    request_.headers['Accept-Encoding'] = 'identity'
+    assert pmxbot.web.viewer.negotiate_encoding() is None
+
+
+def test_day_page_compressed(logger, request_):
+    request_.headers['Accept-Encoding'] = 'gzip'
+    body = pmxbot.web.viewer.DayPage().default('inane', '2020-01-01')
+    headers = cherrypy.response.headers
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['ETag'].endswith('-gzip"')
+    assert b'inane' in gzip.decompress(body)
+
+
+def test_small_page_not_compressed(request_):
+    request_.headers['Accept-Encoding'] = 'gzip'
+    assert pmxbot.web.viewer.compress(b'small', 'gzip') == b'small'
+    assert 'Content-Encoding' not in cherrypy.response.headers
+
+
+def test_day_page_range(logger, request_):
+    for hour in range(3):
+        logger.db.execute(
+            'INSERT INTO logs (datetime, channel, nick, message) VALUES (?, ?, ?, ?)',
+            [f'2020-01-01 0{hour}:30:00', 'inane', 'nik', f'hour {hour}'],
+        )
+    page = pmxbot.web.viewer.DayPage()
+    text = page.default('inane', '2020-01-01', **{'from': '01:00'}).decode('utf-8')
+    assert 'hour 0' not in text
+    assert 'hour 1' in text
+    assert 'hour 2' in text
+    chunks = page.default('inane', '2020-01-01', format='json', to='01:00')
+    lines = json.loads(b''.join(chunks))
+    assert lines == [dict(time='00:30:00', nick='nik', message='hour 0')]
+    with pytest.raises(cherrypy.HTTPError):
+        page.default('inane', '2020-01-01', to='1 am')
+
+
+@pytest.mark.parametrize('day', ['yesterday', '2020-02-30', '20200101'])
+def test_day_page_bad_day(logger, request_, day):
+    with pytest.raises(cherrypy.HTTPError) as exc:
+        pmxbot.web.viewer.DayPage().default('inane', day)
+    assert exc.value.status == 400
+    with pytest.raises(cherrypy.HTTPError) as exc:
+        pmxbot.web.viewer.ApiPage().day('inane', day)
+    assert exc.value.status == 400
+
+
+def test_day_page_loads_rest(logger, request_, monkeypatch):
+    for hour in range(3):
+        logger.db.execute(
+            'INSERT INTO logs (datetime, channel, nick, message) VALUES (?, ?, ?, ?)',
+            [f'2020-01-01 0{hour}:30:00', 'inane', 'nik', f'hour {hour}'],
+        )
+    monkeypatch.setattr(pmxbot.web.viewer.DayPage, 'page_size', 1)
+    text = pmxbot.web.viewer.DayPage().default('inane', '2020-01-01').decode('utf-8')
+    assert 'hour 0' in text
+    assert 'hour 1' not in text
+    assert 'load_hour(1)' in text
+
+
+class TestApi:
+    @pytest.fixture
+    def api(self, logger, request_):
+        logger.message('#inane', 'nik', 'first message')
+        logger.message('#other', 'nak', 'second message')
+        return pmxbot.web.viewer.ApiPage()
+
+    def test_channels(self, api):
+        channels = json.loads(api.channels())
+        assert [chan['channel'] for chan in channels] == ['inane', 'other']
+        assert channels[0]['message'] == 'first message'
+        assert cherrypy.response.headers['Content-Type'] == 'application/json'
+
+    def test_channel(self, api):
+        (day,) = json.loads(api.channel('inane'))
+        assert day['messages'] == 1
+
+    def test_export(self, api, logger):
+        (day,) = logger.get_channel_days('inane')
+        lines = b''.join(api.export('inane', start=day)).splitlines()
+        assert [json.loads(line)['message'] for line in lines] == ['first message']
+        assert not b''.join(api.export('inane', end='2000-01-01'))
+        with pytest.raises(cherrypy.HTTPError):
+            api.export('inane', start='yesterday')
+
+    def test_search(self, api):
+        found = json.loads(api.search('second'))
+        (result,) = found['results']
+        assert result['channel'] == 'other'
+        (line,) = (line for line in result['lines'] if 'second' in line['message'])
+        assert line['message'] == 'second message'
+        assert line['highlights'] == [[0, 6]]
+        assert found['next'] is None
+        found = json.loads(api.search('message', limit='1'))
+        (result,) = json.loads(api.search('message', before=found['next']))['results']
+        assert result['channel'] == 'inane'
+        with pytest.raises(cherrypy.HTTPError) as exc:
+            api.search('message', before='yesterday')
+        assert exc.value.status == 400
+        with pytest.raises(cherrypy.HTTPError) as exc:
+            api.search(' ')
+        assert exc.value.status == 400
+
+    def test_karma(self, api, tmp_path, monkeypatch):
+        store = pmxbot.karma.Karma.from_URI(f'sqlite:{tmp_path / "karma.sqlite"}')
+        monkeypatch.setattr(pmxbot.karma.Karma, 'store', store, raising=False)
+        store.change('foo', 3)
+        store.change('bar', -1)
+        items = json.loads(api.karma(select='-1'))
+        assert items == [dict(names=['bar'], value=-1)]
+        items = json.loads(api.karma(term='ba*'))
+        assert items == [dict(names=['bar'], value=-1)]
+        with pytest.raises(cherrypy.HTTPError):
+            api.karma(term='foo', limit='all')
+        items = json.loads(api.trending(select='1'))
+        assert items == [dict(names=['foo'], change=3)]
+        store.close()
+
+
+def test_make_app(logger, monkeypatch, tmp_path):
+    """
+    make_app returns the viewer as a WSGI application, mounted at
+    the configured base.
+    """
+    monkeypatch.setattr(pmxbot.core, '_load_library_extensions', lambda: None)
+    monkeypatch.setattr(cherrypy, 'tree', cherrypy._cptree.Tree())
+    config = tmp_path / 'config.yaml'
+    config.write_text('web_base: /logs\n')
+    app = pmxbot.web.viewer.make_app(str(config))
+    logger.message('#inane', 'nik', 'a message')
+
+    environ = {}
+    wsgiref.util.setup_testing_defaults(environ)
+    environ.update(SCRIPT_NAME='/logs', PATH_INFO='/api/channels')
+    statuses = []
+    body = b''.join(app(environ, lambda status, headers: statuses.append(status)))
+    assert statuses == ['200 OK']
+    assert [channel['channel'] for channel in json.loads(body)] == ['inane']
+
+
+def test_make_app_hides_tracebacks(logger, monkeypatch, tmp_path):
+    monkeypatch.setattr(pmxbot.core, '_load_library_extensions', lambda: None)
+    monkeypatch.setattr(cherrypy, 'tree', cherrypy._cptree.Tree())
+
+    @cherrypy.expose
+    def channels(self):
+        raise RuntimeError("secret")
+
+    monkeypatch.setattr(pmxbot.web.viewer.ApiPage, 'channels', channels)
+    app = pmxbot.web.viewer.make_app(dict(web_base='/'))
+    environ = {}
+    wsgiref.util.setup_testing_defaults(environ)
+    environ.update(PATH_INFO='/api/channels')
+    statuses = []
+    body = b''.join(app(environ, lambda status, headers: statuses.append(status)))
+    assert statuses[0].startswith('500')
+    assert b'secret' not in body